@@ -0,0 +1,258 @@
+"""Versioned JSON API for the mobile client.
+
+Mirrors the read-only HTML pages with the same model queries, so both get
+the same indexes and eager loads:
+
+    GET /api/v1/timeline                 the logged-in user's home timeline
+    GET /api/v1/users/<id>               a profile and a page of its messages
+    GET /api/v1/users/<id>/likes         messages a user liked
+    GET /api/v1/users/<id>/following     users a user follows
+    GET /api/v1/users/<id>/followers     users following a user
+    GET /api/v1/messages/<id>            one message
+
+Message lists take the same `before`/`after` cursors as the HTML pages.
+Follow lists can be long, so they're streamed out as the rows are read
+and paged by user id with `after_id` and `limit`.
+
+Sparse fieldsets: `fields[message]=id,text` and `fields[user]=id,username`
+choose which fields each kind of object is serialized with.
+"""
+
+import json
+from datetime import datetime
+from functools import lru_cache
+
+from flask import Blueprint, Response, abort, g, request, stream_with_context
+from werkzeug.exceptions import HTTPException
+
+from models import Message, TimelineEntry, User
+from replica import read_only
+
+
+API_VERSION = "v1"
+FOLLOW_LIST_LIMIT = 1000
+
+api = Blueprint("api", __name__, url_prefix=f"/api/{API_VERSION}")
+
+# compact, and skips the circular-reference check our plain dicts don't need
+_encoder = json.JSONEncoder(
+    separators=(",", ":"), ensure_ascii=False, check_circular=False
+)
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+USER_FIELDS = (
+    "id",
+    "username",
+    "image_url",
+    "header_image_url",
+    "bio",
+    "location",
+    "messages_count",
+    "following_count",
+    "followers_count",
+    "likes_count",
+)
+
+MESSAGE_FIELDS = ("id", "text", "timestamp", "user_id", "user", "liked")
+
+DEFAULT_FIELDS = {
+    "user": ("id", "username", "image_url"),
+    "message": ("id", "text", "timestamp", "user", "liked"),
+}
+
+ALLOWED_FIELDS = {"user": USER_FIELDS, "message": MESSAGE_FIELDS}
+
+
+def fieldset(kind, default=None):
+    """The fields requested for `kind` objects, as a tuple.
+
+    Unknown fields are a 400 rather than silently dropped, so a client's
+    typo doesn't look like missing data.
+    """
+
+    requested = request.args.get(f"fields[{kind}]")
+    if requested is None:
+        return default or DEFAULT_FIELDS[kind]
+
+    fields = tuple(name for name in requested.split(",") if name)
+    unknown = set(fields) - set(ALLOWED_FIELDS[kind])
+    if unknown:
+        abort(400, f"unknown {kind} field(s): {', '.join(sorted(unknown))}")
+    return fields
+
+
+@lru_cache(maxsize=256)
+def user_serializer(fields):
+    """Function turning a `User` into a dict of `fields`."""
+
+    def serialize(user):
+        return {name: _isoformat(getattr(user, name)) for name in fields}
+
+    return serialize
+
+
+@lru_cache(maxsize=256)
+def message_serializer(fields, user_fields):
+    """Function turning a `Message` into a dict of `fields`.
+
+    "user" embeds the author with `user_fields`; "liked" is read from the
+    set of liked ids passed in, so a page is answered in one query.
+    """
+
+    plain = tuple(name for name in fields if name not in ("user", "liked"))
+    with_user = "user" in fields
+    with_liked = "liked" in fields
+    serialize_user = user_serializer(user_fields)
+
+    def serialize(msg, liked_ids=frozenset()):
+        data = {name: _isoformat(getattr(msg, name)) for name in plain}
+        if with_user:
+            data["user"] = serialize_user(msg.user)
+        if with_liked:
+            data["liked"] = msg.id in liked_ids
+        return data
+
+    return serialize
+
+
+def json_response(data, status=200):
+    return Response(_encoder.encode(data), status, mimetype="application/json")
+
+
+def liked_ids_for(messages, fields):
+    """Ids of `messages` the viewer liked, if the "liked" field is wanted."""
+
+    if not g.user or "liked" not in fields:
+        return frozenset()
+    return g.user.liked_message_ids(messages)
+
+
+def message_page(page, extra=None):
+    """JSON response for a `Page` of messages."""
+
+    fields = fieldset("message")
+    serialize = message_serializer(fields, fieldset("user"))
+    liked_ids = liked_ids_for(page.items, fields)
+
+    return json_response(
+        {
+            **(extra or {}),
+            "data": [serialize(msg, liked_ids) for msg in page.items],
+            "older": page.older,
+            "newer": page.newer,
+        }
+    )
+
+
+def stream_users(query):
+    """Streamed JSON response for one `after_id`/`limit` page of `query`.
+
+    Rows are fetched in batches from a server-side cursor and written out
+    as they arrive, so a long list is never held in memory whole.
+    """
+
+    after_id = request.args.get("after_id", 0, type=int)
+    limit = request.args.get("limit", FOLLOW_LIST_LIMIT, type=int)
+    limit = max(1, min(limit, FOLLOW_LIST_LIMIT))
+    serialize = user_serializer(fieldset("user"))
+
+    # run the query now, in the view, so it goes to the same database
+    # (replica or primary) as the rest of the request
+    rows = iter(query.filter(User.id > after_id).limit(limit + 1).yield_per(200))
+
+    def generate():
+        yield '{"data":['
+        next_after_id = None
+        for count, user in enumerate(rows):
+            if count == limit:
+                next_after_id = previous_id
+                break
+            yield ("," if count else "") + _encoder.encode(serialize(user))
+            previous_id = user.id
+        yield f'],"next":{_encoder.encode(next_after_id)}}}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def login_required():
+    if not g.user:
+        abort(401, "log in to use this endpoint")
+
+
+@api.errorhandler(HTTPException)
+def api_error(e):
+    """Errors from the API are JSON too."""
+
+    return json_response({"error": e.description, "status": e.code}, e.code)
+
+
+@api.route("/timeline")
+@read_only
+def timeline():
+    """The logged-in user's home timeline, newest first."""
+
+    login_required()
+    page = TimelineEntry.page_for(
+        g.user.id, before=request.args.get("before"), after=request.args.get("after")
+    )
+    return message_page(page)
+
+
+@api.route("/users/<int:user_id>")
+@read_only
+def user_profile(user_id):
+    """A profile, with the newest page of the user's messages."""
+
+    user = User.active().filter_by(id=user_id).first_or_404()
+    page = Message.page_by_author(
+        user_id, before=request.args.get("before"), after=request.args.get("after")
+    )
+    profile = user_serializer(fieldset("user", default=USER_FIELDS))(user)
+    return message_page(page, {"user": profile})
+
+
+@api.route("/users/<int:user_id>/likes")
+@read_only
+def user_likes(user_id):
+    """Messages `user_id` liked, most recently liked first."""
+
+    User.active().filter_by(id=user_id).first_or_404()
+    page = Message.page_liked_by(
+        user_id, before=request.args.get("before"), after=request.args.get("after")
+    )
+    return message_page(page)
+
+
+@api.route("/users/<int:user_id>/following")
+@read_only
+def user_following(user_id):
+    """Users `user_id` follows, by id."""
+
+    login_required()
+    User.active().filter_by(id=user_id).first_or_404()
+    return stream_users(User.following_of(user_id))
+
+
+@api.route("/users/<int:user_id>/followers")
+@read_only
+def user_followers(user_id):
+    """Users following `user_id`, by id."""
+
+    login_required()
+    User.active().filter_by(id=user_id).first_or_404()
+    return stream_users(User.followers_of(user_id))
+
+
+@api.route("/messages/<int:message_id>")
+@read_only
+def message(message_id):
+    """One message, with its author."""
+
+    msg = Message.visible().filter(Message.id == message_id).first_or_404()
+    fields = fieldset("message")
+    serialize = message_serializer(fields, fieldset("user"))
+    return json_response({"data": serialize(msg, liked_ids_for([msg], fields))})
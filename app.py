@@ -1,13 +1,51 @@
+import hashlib
+import json
 import os
-
-from flask import Flask, render_template, request, flash, redirect, session, g
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import click
+from flask import (
+    Flask,
+    render_template,
+    request,
+    flash,
+    redirect,
+    session,
+    g,
+    abort,
+    jsonify,
+    make_response,
+    Response,
+)
 from flask_debugtoolbar import DebugToolbarExtension
 from sqlalchemy.exc import IntegrityError
 from forms import UserAddForm, LoginForm, MessageForm, EditUserForm
-from models import db, connect_db, User, Message, Likes, Follows
+from markupsafe import Markup
+from cache import FragmentCache, TTLCache
+from hashing import HasherBusy
+import query_stats
+from purge import purger, pending_user_ids, purge_user
+import migrations
+import replica
+from replica import read_only
+from api import api
+from pubsub import HubFull, hub
+from models import (
+    db,
+    connect_db,
+    User,
+    CurrentUser,
+    Message,
+    Likes,
+    Follows,
+    TimelineEntry,
+    UserSearchGram,
+)
 
 
 CURR_USER_KEY = "curr_user"
+USERS_PER_PAGE = 60
 
 app = Flask(__name__)
 
@@ -16,13 +54,114 @@ app = Flask(__name__)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
     "DATABASE_URL", "postgresql:///warbler"
 )
+# optional read replica for the read-only views; see replica.py
+if os.environ.get("REPLICA_DATABASE_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {
+        replica.REPLICA_BIND: os.environ["REPLICA_DATABASE_URL"]
+    }
+# how long a user's reads stay on the primary after they write
+app.config["REPLICA_STICKY_SECONDS"] = 5
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SQLALCHEMY_ECHO"] = False
 # app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "it's a secret")
 # toolbar = DebugToolbarExtension(app)
 
+# bcrypt cost and the worker pool that password hashing runs on
+app.config["BCRYPT_LOG_ROUNDS"] = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
+app.config["PASSWORD_HASH_MAX_PENDING"] = 64
+
+# snapshots of logged-in users, so each request doesn't refetch the user row
+app.config["CURRENT_USER_CACHE_SIZE"] = 10000
+app.config["CURRENT_USER_CACHE_TTL"] = 30
+
+# rendered message and user cards; see message_card()/user_card()
+app.config["FRAGMENT_CACHE_SIZE"] = 50000
+app.config["FRAGMENT_CACHE_CHARS"] = 64 * 1024 * 1024
+
+# per-request query counts/timings, and the repeat count logged as an N+1
+app.config["QUERY_STATS_HEADERS"] = True
+app.config["QUERY_STATS_REPEAT_THRESHOLD"] = 5
+
+# rows per chunk when purging deleted accounts, and whether to purge in
+# the request instead of on the background thread
+app.config["PURGE_BATCH_SIZE"] = 1000
+app.config["PURGE_INLINE"] = False
+
+# live timeline connections: the cap on open ones, events buffered per
+# connection, seconds between keepalives and the client's reconnect delay
+app.config["LIVE_MAX_SUBSCRIBERS"] = 1000
+app.config["LIVE_QUEUE_SIZE"] = 50
+app.config["LIVE_KEEPALIVE"] = 15
+app.config["LIVE_RETRY_MS"] = 5000
+
 connect_db(app)
+query_stats.init_app(app)
+purger.init_app(app)
+replica.init_app(app)
+app.register_blueprint(api)
+hub.init_app(app)
+
+current_users = TTLCache(
+    maxsize=app.config["CURRENT_USER_CACHE_SIZE"],
+    ttl=app.config["CURRENT_USER_CACHE_TTL"],
+)
+
+fragments = FragmentCache(
+    maxsize=app.config["FRAGMENT_CACHE_SIZE"],
+    max_chars=app.config["FRAGMENT_CACHE_CHARS"],
+)
+
+
+##############################################################################
+# Cached fragments
+#
+# Message and user cards look the same to every viewer, so they're rendered
+# once and reused. Keys include the profile fields a card shows, so an edit
+# is a miss everywhere; profile() and messages_destroy() also invalidate
+# their tags to free the space. Per-viewer buttons are rendered around the
+# cards, or punched into the ACTIONS_SLOT of user cards.
+
+ACTIONS_SLOT = Markup("<!--actions-->")
+
+
+@app.template_global()
+def message_card(msg, author=None):
+    """Markup for `msg`'s author, timestamp and text."""
+
+    author = author or msg.user
+    key = ("message", msg.id, author.id, author.username, author.image_url)
+    html = fragments.get(key)
+
+    if html is None:
+        html = Markup(render_template("messages/card.html", msg=msg, author=author))
+        fragments.set(key, html, tags=(("user", author.id), ("message", msg.id)))
+
+    return html
+
+
+@app.template_global()
+def user_card(user, actions=""):
+    """Markup for `user`'s card, with the viewer's `actions` (buttons) in it."""
+
+    key = (
+        "user",
+        user.id,
+        user.username,
+        user.image_url,
+        user.header_image_url,
+        user.bio,
+    )
+    html = fragments.get(key)
+
+    if html is None:
+        html = Markup(
+            render_template("users/card.html", user=user, actions=ACTIONS_SLOT)
+        )
+        fragments.set(key, html, tags=(("user", user.id),))
+
+    return html.replace(ACTIONS_SLOT, Markup(actions))
 
 
 ##############################################################################
@@ -31,18 +170,41 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get_or_404(session[CURR_USER_KEY])
+    g.user is a cached `CurrentUser` snapshot; use `current_user()` to get
+    the full `User` when a view needs to change it.
+    """
+
+    if CURR_USER_KEY in session and request.endpoint != "static":
+        user_id = session[CURR_USER_KEY]
+        g.user = current_users.get(user_id)
+
+        if g.user is None:
+            g.user = CurrentUser.load(user_id) or abort(404)
+            current_users.set(user_id, g.user)
 
     else:
         g.user = None
 
 
+def current_user():
+    """Load the full `User` row for the logged-in user."""
+
+    return User.query.get_or_404(g.user.id)
+
+
+def forget_current_user():
+    """Drop the logged-in user's cached snapshot after they change."""
+
+    if g.user:
+        current_users.pop(g.user.id)
+
+
 def do_login(user):
     """Log in user."""
 
+    current_users.pop(user.id)
     session[CURR_USER_KEY] = user.id
 
 
@@ -75,6 +237,8 @@ def signup():
                 email=form.email.data,
                 image_url=form.image_url.data or User.image_url.default.arg,
             )
+            db.session.flush()
+            UserSearchGram.index_user(user)
             db.session.commit()
 
         except IntegrityError:
@@ -99,6 +263,8 @@ def login():
         user = User.authenticate(form.username.data, form.password.data)
 
         if user:
+            # keeps the upgraded hash if authenticate rehashed the password
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -111,6 +277,7 @@ def login():
 @app.route("/logout")
 def logout():
     """Handle logout of user."""
+    forget_current_user()
     session.pop(CURR_USER_KEY)
     flash("Logged out.", "success")
     return redirect("/login")
@@ -120,41 +287,92 @@ def logout():
 # General user routes:
 
 
+def following_ids_for(users):
+    """Ids of `users` the current user follows, for follow/unfollow buttons."""
+
+    if not g.user:
+        return set()
+    return g.user.following_ids_among(user.id for user in users)
+
+
 @app.route("/users")
+@read_only
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by username, bio and
+    location; results are ranked and capped at USERS_PER_PAGE. Without 'q',
+    users are listed by id, paged with an 'after_id' param.
     """
 
-    search = request.args.get("q")
+    search = request.args.get("q", "").strip()
+    next_after_id = None
 
     if not search:
-        users = User.query.all()
+        after_id = request.args.get("after_id", 0, type=int)
+        users = (
+            User.active().filter(User.id > after_id)
+            .order_by(User.id)
+            .limit(USERS_PER_PAGE + 1)
+            .all()
+        )
+        if len(users) > USERS_PER_PAGE:
+            users = users[:USERS_PER_PAGE]
+            next_after_id = users[-1].id
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        users = UserSearchGram.search(search, limit=USERS_PER_PAGE)
+
+    return conditional_response(
+        lambda: render_template(
+            "users/index.html",
+            users=users,
+            following_ids=following_ids_for(users),
+            next_after_id=next_after_id,
+        ),
+        [(user.id, user.updated_at) for user in users],
+    )
+
 
-    return render_template("users/index.html", users=users)
+@app.route("/users/autocomplete")
+def autocomplete_users():
+    """JSON list of users whose username starts with the 'q' param."""
+
+    users = UserSearchGram.autocomplete(request.args.get("q", ""))
+    return jsonify(
+        [
+            {"id": user.id, "username": user.username, "image_url": user.image_url}
+            for user in users
+        ]
+    )
 
 
 @app.route("/users/<int:user_id>")
+@read_only
 def users_show(user_id):
     """Show user profile."""
 
-    user = User.query.get_or_404(user_id)
+    user = User.active().filter_by(id=user_id).first_or_404()
 
-    # snagging messages in order from the database;
-    # user.messages won't be in order by default
-    messages = (
-        Message.query.filter(Message.user_id == user_id)
-        .order_by(Message.timestamp.desc())
-        .limit(100)
-        .all()
-    )
-    return render_template("users/show.html", user=user, messages=messages)
+    def render():
+        # snagging messages in order from the database;
+        # user.messages won't be in order by default
+        page = Message.page_by_author(
+            user_id, before=request.args.get("before"), after=request.args.get("after")
+        )
+        return render_template(
+            "users/show.html",
+            user=user,
+            messages=page.items,
+            page=page,
+            following_ids=following_ids_for([user]),
+        )
+
+    # messages_count covers the messages, and is part of updated_at
+    return conditional_response(render, user.updated_at, user.updated_at)
 
 
 @app.route("/users/<int:user_id>/following")
+@read_only
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -162,11 +380,22 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template("users/following.html", user=user)
+    user = User.active().filter_by(id=user_id).first_or_404()
+    following = User.following_of(user_id).all()
+    users = [user, *following]
+    return conditional_response(
+        lambda: render_template(
+            "users/following.html",
+            user=user,
+            following=following,
+            following_ids=following_ids_for(users),
+        ),
+        [(u.id, u.updated_at) for u in users],
+    )
 
 
 @app.route("/users/<int:user_id>/followers")
+@read_only
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -174,8 +403,18 @@ def users_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template("users/followers.html", user=user)
+    user = User.active().filter_by(id=user_id).first_or_404()
+    followers = User.followers_of(user_id).all()
+    users = [user, *followers]
+    return conditional_response(
+        lambda: render_template(
+            "users/followers.html",
+            user=user,
+            followers=followers,
+            following_ids=following_ids_for(users),
+        ),
+        [(u.id, u.updated_at) for u in users],
+    )
 
 
 @app.route("/users/follow/<int:follow_id>", methods=["POST"])
@@ -187,9 +426,14 @@ def add_follow(follow_id):
         return redirect("/")
 
     if follow_id != g.user.id:
-        followed_user = User.query.get_or_404(follow_id)
-        g.user.following.append(followed_user)
+        user = current_user()
+        followed_user = User.active().filter_by(id=follow_id).first_or_404()
+        user.following.append(followed_user)
+        User.adjust_counters(g.user.id, following_count=1)
+        User.adjust_counters(follow_id, followers_count=1)
+        TimelineEntry.add_author(g.user.id, follow_id)
         db.session.commit()
+        forget_current_user()
         return redirect(f"/users/{g.user.id}/following")
     flash("You can not follow yourself!", "danger")
     return redirect("/")
@@ -203,9 +447,14 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    user = current_user()
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.remove(followed_user)
+    user.following.remove(followed_user)
+    User.adjust_counters(g.user.id, following_count=-1)
+    User.adjust_counters(follow_id, followers_count=-1)
+    TimelineEntry.remove_author(g.user.id, follow_id)
     db.session.commit()
+    forget_current_user()
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -221,22 +470,20 @@ def profile():
     form = EditUserForm()
     if form.validate_on_submit():
         if User.authenticate(g.user.username, form.password.data):
-            user = User.query.get_or_404(g.user.id)
-            user.username = (
-                form.username.data if form.username.data else g.user.username
-            )
-            user.email = form.email.data if form.email.data else g.user.email
-            user.image_url = (
-                form.image_url.data if form.image_url.data else g.user.image_url
-            )
+            user = current_user()
+            user.username = form.username.data or user.username
+            user.email = form.email.data or user.email
+            user.image_url = form.image_url.data or user.image_url
             user.header_image_url = (
-                form.header_image_url.data
-                if form.header_image_url.data
-                else g.user.header_image_url
+                form.header_image_url.data or user.header_image_url
             )
-            user.bio = form.bio.data if form.bio.data else g.user.bio
+            user.bio = form.bio.data or user.bio
+            user.updated_at = datetime.utcnow()
             db.session.add(user)
+            UserSearchGram.index_user(user)
             db.session.commit()
+            forget_current_user()
+            fragments.invalidate(("user", user.id))
             return redirect(f"/users/{g.user.id}")
         flash("Incorrect Password", "danger")
         return redirect("/")
@@ -254,11 +501,15 @@ def delete_user():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    # hide the account now; its rows are purged in the background
+    user = current_user()
     do_logout()
-    for msg in g.user.messages:
-        db.session.delete(msg)
-    db.session.delete(g.user)
+    user.deleted_at = datetime.utcnow()
+    UserSearchGram.remove_user(user.id)
     db.session.commit()
+    forget_current_user()
+    fragments.invalidate(("user", user.id))
+    purger.submit(user.id)
 
     return redirect("/signup")
 
@@ -281,9 +532,14 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        User.adjust_counters(g.user.id, messages_count=1)
+        TimelineEntry.fan_out(msg)
         db.session.commit()
+        forget_current_user()
+        publish_message(msg)
 
         return redirect(f"/users/{g.user.id}")
 
@@ -291,11 +547,19 @@ def messages_add():
 
 
 @app.route("/messages/<int:message_id>", methods=["GET"])
+@read_only
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get_or_404(message_id)
-    return render_template("messages/show.html", message=msg)
+    msg = Message.visible().filter(Message.id == message_id).first_or_404()
+
+    # messages never change; only their author's profile and the viewer's
+    # follow of them (part of the viewer's updated_at) can
+    return conditional_response(
+        lambda: render_template("messages/show.html", message=msg),
+        (msg.id, msg.user.updated_at),
+        msg.user.updated_at,
+    )
 
 
 @app.route("/messages/<int:message_id>/delete", methods=["POST"])
@@ -308,8 +572,15 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    TimelineEntry.remove_message(msg.id)
+    User.adjust_counters(msg.user_id, messages_count=-1)
+    User.adjust_counters(
+        db.select(Likes.user_id).where(Likes.message_id == msg.id), likes_count=-1
+    )
     db.session.delete(msg)
     db.session.commit()
+    forget_current_user()
+    fragments.invalidate(("message", message_id))
 
     return redirect(f"/users/{g.user.id}")
 
@@ -326,11 +597,14 @@ def like_message(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    current_msg = Message.query.get_or_404(message_id)
-    if current_msg in g.user.likes:
-        g.user.likes.remove(current_msg)
-        db.session.add(g.user)
+    current_msg = Message.visible().filter(Message.id == message_id).first_or_404()
+    user = current_user()
+    if current_msg in user.likes:
+        user.likes.remove(current_msg)
+        User.adjust_counters(g.user.id, likes_count=-1)
+        db.session.add(user)
         db.session.commit()
+        forget_current_user()
         return redirect("/")
 
     if g.user.id == current_msg.user_id:
@@ -339,17 +613,37 @@ def like_message(message_id):
 
     new_like = Likes(user_id=g.user.id, message_id=message_id)
     db.session.add(new_like)
+    User.adjust_counters(g.user.id, likes_count=1)
     db.session.commit()
+    forget_current_user()
 
     return redirect("/")
 
 
+def liked_ids_for(messages):
+    """Ids of `messages` liked by the current user, for like buttons."""
+
+    if not g.user:
+        return set()
+    return g.user.liked_message_ids(messages)
+
+
 @app.route("/users/<int:user_id>/likes", methods=["GET"])
+@read_only
 def show_liked_messages(user_id):
-    """shows likes page for a user"""
-    user = User.query.get_or_404(user_id)
-    messages = Message.query.all()
-    return render_template("users/likes.html", user=user, messages=messages)
+    """shows likes page for a user, most recently liked first"""
+    user = User.active().filter_by(id=user_id).first_or_404()
+    page = Message.page_liked_by(
+        user_id, before=request.args.get("before"), after=request.args.get("after")
+    )
+    return render_template(
+        "users/likes.html",
+        user=user,
+        messages=page.items,
+        page=page,
+        liked_ids=liked_ids_for(page.items),
+        following_ids=following_ids_for([user]),
+    )
 
 
 ##############################################################################
@@ -357,23 +651,28 @@ def show_liked_messages(user_id):
 
 
 @app.route("/")
+@read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: 100 most recent messages of followed_users, read from the
+      user's materialized timeline; `before`/`after` cursors page through it
     """
 
     if g.user:
-        following_ids = [following.id for following in g.user.following]
-        messages = (
-            Message.query.filter(Message.user_id.in_([*following_ids, g.user.id]))
-            .order_by(Message.timestamp.desc())
-            .limit(100)
-            .all()
+        page = TimelineEntry.page_for(
+            g.user.id,
+            before=request.args.get("before"),
+            after=request.args.get("after"),
         )
 
-        return render_template("home.html", messages=messages)
+        return render_template(
+            "home.html",
+            messages=page.items,
+            page=page,
+            liked_ids=liked_ids_for(page.items),
+        )
 
     else:
         return render_template("home-anon.html")
@@ -391,20 +690,216 @@ def page_not_found(e):
     return (render_template("405.html"), 405)
 
 
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    """Asks the client to retry when the password hashing queue is full"""
+    return (
+        "Too many sign-ins right now; please try again shortly.",
+        503,
+        {"Retry-After": "5"},
+    )
+
+
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
+# Live timeline
 #
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# The home page keeps one server-sent events connection open to
+# /timeline/stream instead of being reloaded to check for new messages.
+# messages_add publishes each new message to the hub for those of the
+# author's followers who are connected, rendered once as a message card.
+
+
+def publish_message(msg):
+    """Push `msg` to the live timelines of its author and their followers."""
+
+    connected = hub.subscriber_ids()
+    if not connected:
+        return
+
+    recipients = Follows.follower_ids_among(msg.user_id, connected)
+    if msg.user_id in connected:
+        recipients.add(msg.user_id)
+    if recipients:
+        hub.publish(recipients, {"id": msg.id, "html": str(message_card(msg))})
+
+
+@app.route("/timeline/stream")
+def timeline_stream():
+    """Stream messages newly posted to the user's timeline, as SSE.
+
+    Sends a "reset" event and closes if the connection fell too far behind;
+    answers 503 once LIVE_MAX_SUBSCRIBERS connections are open.
+    """
+
+    if not g.user:
+        abort(401)
+
+    try:
+        subscription = hub.subscribe(g.user.id)
+    except HubFull:
+        return ("Too many live connections.", 503, {"Retry-After": "30"})
+
+    keepalive = app.config["LIVE_KEEPALIVE"]
+    retry = app.config["LIVE_RETRY_MS"]
+
+    def events():
+        try:
+            yield f"retry: {retry}\n\n"
+            while True:
+                event = subscription.get(timeout=keepalive)
+                if subscription.overflowed:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+##############################################################################
+# Management commands
+
+
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """Bring the database schema up to date with the models."""
+
+    applied = migrations.upgrade()
+    print(f"Applied {len(applied)} migration(s).")
+
+
+@app.cli.command("backfill-timelines")
+def backfill_timelines():
+    """Rebuild every user's home timeline from follows and messages."""
+
+    count = TimelineEntry.backfill()
+    db.session.commit()
+    print(f"Wrote {count} timeline entries.")
+
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    """Rebuild the user search trigram index from the users table."""
+
+    count = UserSearchGram.rebuild()
+    db.session.commit()
+    print(f"Indexed {count} users.")
+
+
+@app.cli.command("reconcile-counters")
+@click.option("--dry-run", is_flag=True, help="Report drift without fixing it.")
+def reconcile_counters(dry_run):
+    """Recompute users' message/follow/like counters and report any drift."""
+
+    drift = User.reconcile_counters(fix=not dry_run)
+    db.session.commit()
+
+    for user_id, counter, stored, actual in drift:
+        print(f"user #{user_id}: {counter} was {stored}, actually {actual}")
+    print(f"{len(drift)} counter(s) drifted{'' if dry_run else ' and were fixed'}.")
+
+
+@app.cli.command("purge-deleted-users")
+def purge_deleted_users():
+    """Finish purging accounts that were deleted, e.g. after a restart."""
+
+    def progress(user_id, step, done):
+        print(f"user #{user_id}: {done:,} {step} removed")
+
+    for user_id in pending_user_ids():
+        purge_user(user_id, app.config["PURGE_BATCH_SIZE"], progress)
+
+
+##############################################################################
+# HTTP caching
+#
+# Pages are personal (navbar, follow and like buttons), so they're cached
+# privately and revalidated on every view: the ETag hashes the URL, the
+# viewer's row version and the versions of the rows on the page, and a
+# matching If-None-Match gets a 304 without rendering. Static files are
+# linked with a content hash (?v=...) and cached forever.
+
+
+def conditional_response(render, versions, last_modified=None):
+    """Return `render()` with validators, or a 304 if the client is current.
+
+    `versions` must change whenever the page would, e.g. the ids and
+    `updated_at`s of the rows shown; `last_modified` is the newest of those
+    timestamps, when they cover everything on the page.
+    """
+
+    # read the viewer's version fresh: the cached g.user snapshot is only
+    # dropped in the worker that handled their last write
+    viewer = None
+    if g.user:
+        updated_at = (
+            db.session.query(User.updated_at).filter(User.id == g.user.id).scalar()
+        )
+        viewer = (g.user.id, updated_at)
+    key = repr((request.full_path, viewer, versions))
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    if last_modified and viewer:
+        last_modified = max(last_modified, viewer[1])
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif last_modified and request.if_modified_since:
+        fresh = (
+            last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+            <= request.if_modified_since
+        )
+    else:
+        fresh = False
+
+    # a 304 would leave pending flash messages unshown
+    if fresh and "_flashes" not in session:
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
+
+
+@lru_cache(maxsize=256)
+def file_version(path, mtime):
+    """Short content hash of the file at `path` (`mtime` busts the cache)."""
+
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+
+@app.url_defaults
+def version_static_urls(endpoint, values):
+    """Add a content hash to static URLs so they can be cached forever."""
+
+    if endpoint == "static" and "filename" in values:
+        path = os.path.join(app.static_folder, values["filename"])
+        if os.path.isfile(path):
+            values["v"] = file_version(path, os.path.getmtime(path))
 
 
 @app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers["Cache-Control"] = "public, max-age=0"
-    return req
+def set_cache_policy(response):
+    """Immutable caching for versioned static files; revalidate pages."""
+
+    if request.endpoint == "static":
+        if "v" in request.args:
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 60 * 60
+            response.cache_control.immutable = True
+    elif "Cache-Control" not in response.headers:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+    return response
@@ -0,0 +1,92 @@
+"""Benchmark password hashing throughput and login latency.
+
+For each bcrypt cost, reports how many hashes/sec the worker pool sustains
+and the latency of `check` (what a login waits for) while that many
+concurrent logins are in flight.
+
+Run from the project root, e.g.:
+
+    python -m benchmarks.bench_hashing --rounds 4 8 10 12 --concurrency 16
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hashing import PasswordHasher
+
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(samples, pct):
+    """Return the `pct`th percentile of `samples` (nearest rank)."""
+
+    ordered = sorted(samples)
+    index = max(0, round(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def bench_rounds(rounds, workers, concurrency, requests):
+    """Measure one bcrypt cost; returns a dict of results."""
+
+    hasher = PasswordHasher(
+        rounds=rounds, max_workers=workers, max_pending=concurrency
+    )
+    hashed = hasher.hash(PASSWORD)
+
+    def timed(fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    # simulated clients, each blocking on the hasher like a request thread
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        start = time.perf_counter()
+        list(clients.map(lambda _: hasher.hash(PASSWORD), range(requests)))
+        hash_elapsed = time.perf_counter() - start
+
+        latencies = list(
+            clients.map(lambda _: timed(hasher.check, hashed, PASSWORD), range(requests))
+        )
+
+    return {
+        "rounds": rounds,
+        "hashes_per_sec": round(requests / hash_elapsed, 2),
+        "auth_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "auth_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "auth_mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[4, 8, 10, 12])
+    parser.add_argument("--workers", type=int, default=4, help="hasher pool size")
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="simultaneous simulated logins"
+    )
+    parser.add_argument("--requests", type=int, default=64, help="hashes per cost")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rounds':>6} {'hashes/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+
+    for rounds in args.rounds:
+        result = bench_rounds(rounds, args.workers, args.concurrency, args.requests)
+        results.append(result)
+        print(
+            f"{rounds:>6} {result['hashes_per_sec']:>10} "
+            f"{result['auth_p50_ms']:>9} {result['auth_p95_ms']:>9}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Load-test Warbler's main routes and report latency percentiles.
+
+Seeds a database at the requested scale (generator + seed loader), then for
+each route runs `--concurrency` simulated users, each with its own logged-in
+Flask test client, and records every request's latency. Prints throughput
+and p50/p95/p99 per route and writes the results as JSON so runs can be
+diffed across changes (`--compare earlier.json`).
+
+Run from the project root, e.g.:
+
+    python -m benchmarks.bench_routes --database-url postgresql:///warbler_bench \\
+        --users 10000 --messages 200000 --follows 500000 --likes 100000
+
+Pass --skip-seed to reuse an already seeded database.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+# (name, method, path template); {other}, {message} and {query} are filled in
+# at random for every request
+ROUTES = [
+    ("homepage", "GET", "/"),
+    ("users_show", "GET", "/users/{other}"),
+    ("list_users", "GET", "/users"),
+    ("list_users_search", "GET", "/users?q={query}"),
+    ("show_liked_messages", "GET", "/users/{other}/likes"),
+    ("like_message", "POST", "/users/like/{message}"),
+    ("add_follow", "POST", "/users/follow/{other}"),
+    ("messages_add", "POST", "/messages/new"),
+]
+
+SEARCH_TERMS = ["ann", "john", "smith", "mar", "lee", "son", "bob", "kim"]
+
+
+def percentile(samples, pct):
+    """Return the `pct`th percentile of `samples` (nearest rank)."""
+
+    ordered = sorted(samples)
+    index = max(0, round(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def seed_database(options):
+    """Generate CSVs at the requested scale and load them, plus random likes."""
+
+    from app import db
+    from models import Likes, Message, User
+    import seed
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        subprocess.run(
+            [
+                sys.executable,
+                "generator/create_csvs.py",
+                f"--users={options.users}",
+                f"--messages={options.messages}",
+                f"--follows={options.follows}",
+                f"--seed={options.seed}",
+                f"--out-dir={data_dir}",
+            ],
+            check=True,
+        )
+        seed.seed(data_dir)
+
+    rng = random.Random(options.seed)
+    max_message = db.session.query(db.func.max(Message.id)).scalar() or 0
+    pairs = set()
+    target = min(options.likes, options.users * max_message)
+    while len(pairs) < target:
+        pairs.add((rng.randint(1, options.users), rng.randint(1, max_message)))
+
+    pairs = sorted(pairs)
+    for i in range(0, len(pairs), 10000):
+        db.session.execute(
+            Likes.__table__.insert(),
+            [
+                {"user_id": user_id, "message_id": message_id, "timestamp": datetime.utcnow()}
+                for user_id, message_id in pairs[i : i + 10000]
+            ],
+        )
+    User.recount_counters()
+    db.session.commit()
+    print(f"seeded {len(pairs):,} likes")
+
+
+def run_route(app, route, options, id_ranges):
+    """Hammer one route with simulated users; returns its latencies/statuses."""
+
+    from app import CURR_USER_KEY
+
+    name, method, template = route
+    max_user, max_message = id_ranges
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    per_user = options.requests // options.concurrency
+
+    def simulated_user(index):
+        rng = random.Random(f"{options.seed}-{name}-{index}")
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = rng.randint(1, max_user)
+
+        for _ in range(per_user):
+            path = template.format(
+                other=rng.randint(1, max_user),
+                message=rng.randint(1, max_message),
+                query=rng.choice(SEARCH_TERMS),
+            )
+            data = {"text": "benchmark warble"} if name == "messages_add" else None
+
+            start = time.perf_counter()
+            res = client.open(path, method=method, data=data)
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+    threads = [
+        threading.Thread(target=simulated_user, args=(i,))
+        for i in range(options.concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "route": name,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+    }
+
+
+def compare(results, baseline_path):
+    """Print each route's p50/p95 change against an earlier results file."""
+
+    with open(baseline_path) as baseline_file:
+        baseline = {r["route"]: r for r in json.load(baseline_file)["routes"]}
+
+    print(f"\nvs {baseline_path}")
+    for result in results:
+        before = baseline.get(result["route"])
+        if not before:
+            continue
+        deltas = [
+            f"{key} {before[key]:>8} -> {result[key]:>8} "
+            f"({(result[key] - before[key]) / before[key] * 100 if before[key] else 0:+.0f}%)"
+            for key in ("p50_ms", "p95_ms")
+        ]
+        print(f"{result['route']:<22} " + "   ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="postgresql:///warbler_bench")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--follows", type=int, default=50000)
+    parser.add_argument("--likes", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=8, help="simulated users")
+    parser.add_argument("--requests", type=int, default=400, help="requests per route")
+    parser.add_argument(
+        "--routes", nargs="+", help="only these routes", choices=[r[0] for r in ROUTES]
+    )
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    options = parser.parse_args()
+
+    # the app reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = options.database_url
+    from app import app, db
+    from models import Message, User
+
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    if not options.skip_seed:
+        seed_database(options)
+
+    id_ranges = (
+        db.session.query(db.func.max(User.id)).scalar(),
+        db.session.query(db.func.max(Message.id)).scalar(),
+    )
+    db.session.remove()
+
+    results = []
+    print(f"{'route':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for route in ROUTES:
+        if options.routes and route[0] not in options.routes:
+            continue
+        result = run_route(app, route, options, id_ranges)
+        results.append(result)
+        print(
+            f"{result['route']:<22} {result['throughput_rps']:>8} {result['p50_ms']:>8} "
+            f"{result['p95_ms']:>8} {result['p99_ms']:>8}  {result['statuses']}"
+        )
+
+    output = options.output or os.path.join(
+        "benchmarks", "results", f"routes-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as out:
+        json.dump(
+            {
+                "started": datetime.now().isoformat(timespec="seconds"),
+                "scale": {
+                    key: getattr(options, key)
+                    for key in ("users", "messages", "follows", "likes")
+                },
+                "concurrency": options.concurrency,
+                "routes": results,
+            },
+            out,
+            indent=2,
+        )
+    print(f"\nwrote {output}")
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Small process-local caches.
+
+These live in one worker process only, so anything kept in them must be
+safe to serve slightly stale (bounded by the TTL) to other workers, or be
+keyed on the version of what it shows so that other workers simply miss.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    - maxsize: most entries kept; the least recently used is evicted first
+    - ttl: seconds an entry stays valid after it was set
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if missing/expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Cache `value` under `key`, evicting the oldest entry if full."""
+
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Drop `key` from the cache, if it's there."""
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the statistics."""
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return size and hit/miss counts, e.g. for a debug endpoint."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FragmentCache:
+    """A thread-safe LRU cache of rendered markup, bounded in size.
+
+    - maxsize: most fragments kept
+    - max_chars: most characters of markup kept across all fragments
+
+    Fragments can be tagged (e.g. with the ids of the user and message they
+    show) so that everything under a tag can be dropped with `invalidate`.
+    """
+
+    def __init__(self, maxsize=10000, max_chars=16 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the fragment cached under `key`, or `default`."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags=()):
+        """Cache `value` under `key`, evicting the oldest fragments if full."""
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, tags)
+            self.chars += len(value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while self._entries and (
+                len(self._entries) > self.maxsize or self.chars > self.max_chars
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tag):
+        """Drop every fragment tagged with `tag`."""
+
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Drop every fragment and reset the statistics."""
+
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.chars = self.hits = self.misses = 0
+
+    def stats(self):
+        """Return size and hit/miss counts, e.g. for a debug endpoint."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "chars": self.chars,
+                "max_chars": self.max_chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        """Drop `key` and its tag references; the lock must be held."""
+
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        value, tags = entry
+        self.chars -= len(value)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -2,15 +2,34 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows, e.g. for capacity testing:
+
+    python generator/create_csvs.py --users 1000000 --messages 100000000 \\
+        --follows 50000000 --workers 8 --seed 42 --out-dir /data/warbler
+
+Generation runs offline and is reproducible: each chunk of rows gets its own
+RNG derived from --seed, so the same arguments give the same files whatever
+--workers is. Chunks are written in parallel and stitched together in order.
+Followed accounts are drawn from a power-law popularity distribution without
+ever materializing the N x N space of possible pairs.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+import os
+import shutil
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from random import Random
+
 from faker import Faker
-from helpers import get_random_datetime
+from helpers import (
+    HEADER_IMAGE_URLS,
+    IMAGE_URLS,
+    PopularitySampler,
+    get_random_datetime,
+)
 
 MAX_WARBLER_LENGTH = 140
 
@@ -22,56 +41,173 @@ NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
 
-fake = Faker()
+# every seeded user's password is "password"
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+CSV_FILES = {
+    'users': ('users.csv', USERS_CSV_HEADERS),
+    'messages': ('messages.csv', MESSAGES_CSV_HEADERS),
+    'follows': ('follows.csv', FOLLOWS_CSV_HEADERS),
+}
+
+# set in each worker process by init_worker
+popularity = None
+
+
+def chunk_rng(seed, kind, index):
+    """A `Random` for one chunk, independent of how chunks are scheduled."""
+
+    return Random(f'{seed}-{kind}-{index}')
+
+
+def chunk_faker(rng):
+    """A `Faker` seeded from a chunk's RNG."""
+
+    fake = Faker()
+    fake.seed_instance(rng.getrandbits(64))
+    return fake
+
+
+def write_users(writer, rng, first_id, count, options):
+    """Write users first_id..first_id + count - 1."""
+
+    fake = chunk_faker(rng)
+
+    for user_id in range(first_id, first_id + count):
+        # suffix the id so usernames and emails stay unique at any scale
+        local, domain = fake.email().split('@')
+        writer.writerow([
+            f'{local}{user_id}@{domain}',
+            f'{fake.user_name()}{user_id}',
+            rng.choice(IMAGE_URLS),
+            PASSWORD_HASH,
+            fake.sentence(),
+            rng.choice(HEADER_IMAGE_URLS),
+            fake.city(),
+        ])
+
+
+def write_messages(writer, rng, first_id, count, options):
+    """Write `count` messages by random users."""
+
+    # Faker paragraphs are too slow for 100M rows; build text from its words
+    words = chunk_faker(rng).words(nb=500)
+
+    for _ in range(count):
+        text = ' '.join(rng.choices(words, k=rng.randint(4, 24))).capitalize()
+        writer.writerow([
+            f'{text}.'[:MAX_WARBLER_LENGTH],
+            get_random_datetime(rng=rng, now=options.end_date),
+            rng.randint(1, options.users),
+        ])
+
+
+def write_follows(writer, rng, first_id, count, options):
+    """Write `count` follows made by users first_id..first_id + chunk size."""
+
+    last_id = min(first_id + options.chunk_size, options.users + 1)
+    out_degree = [0] * (last_id - first_id)
+    for _ in range(count):
+        out_degree[rng.randrange(len(out_degree))] += 1
+
+    for offset, degree in enumerate(out_degree):
+        follower = first_id + offset
+        for followed in sorted(popularity.sample_distinct(rng, degree, follower)):
+            writer.writerow([followed, follower])
+
+
+WRITERS = {
+    'users': write_users,
+    'messages': write_messages,
+    'follows': write_follows,
+}
+
+
+def init_worker(options):
+    """Build the shared popularity sampler once per worker process."""
+
+    global popularity
+    popularity = PopularitySampler(options.users, options.skew, options.seed)
+
+
+def write_chunk(options, task):
+    """Write one chunk of rows to its own part file; returns its path."""
+
+    kind, index, first_id, count = task
+    path = os.path.join(options.parts_dir, f'{kind}-{index:06d}.csv')
+
+    with open(path, 'w', newline='') as part:
+        WRITERS[kind](csv.writer(part), chunk_rng(options.seed, kind, index), first_id, count, options)
+
+    return path
+
+
+def split(total, chunk_size):
+    """Yield `(index, first_id, count)` for chunks covering 1..total."""
+
+    for index, start in enumerate(range(0, total, chunk_size)):
+        yield index, start + 1, min(chunk_size, total - start)
+
+
+def plan(options):
+    """Return the list of chunk tasks for every CSV."""
+
+    tasks = [('users', *chunk) for chunk in split(options.users, options.chunk_size)]
+    tasks += [('messages', *chunk) for chunk in split(options.messages, options.chunk_size)]
+
+    # follows are chunked by follower, sharing the total out in proportion
+    max_follows = options.users * (options.users - 1)
+    total_follows = min(options.follows, max_follows)
+    for index, first_id, count in split(options.users, options.chunk_size):
+        share = total_follows * (first_id - 1 + count) // options.users
+        share -= total_follows * (first_id - 1) // options.users
+        tasks.append(('follows', index, first_id, share))
+
+    return tasks
+
 
-# Generate random profile image URLs to use for users
+def stitch(options, parts):
+    """Concatenate each kind's part files, in order, under one header."""
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
+    for kind, (filename, headers) in CSV_FILES.items():
+        with open(os.path.join(options.out_dir, filename), 'w', newline='') as out:
+            csv.writer(out).writerow(headers)
+            for path in sorted(p for p in parts if os.path.basename(p).startswith(kind)):
+                with open(path, newline='') as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(path)
 
-# Generate random header image URLs to use for users
+    os.rmdir(options.parts_dir)
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate Warbler CSVs.')
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='rows (or followers) per chunk')
+    parser.add_argument('--skew', type=float, default=1.0, help='power-law exponent of follower counts')
+    parser.add_argument('--end-date', type=datetime.fromisoformat,
+                        default=datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help='latest message timestamp (default: today); fix it for identical output')
+    parser.add_argument('--out-dir', default=os.path.dirname(os.path.abspath(__file__)))
 
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
+    options = parser.parse_args()
+    options.parts_dir = os.path.join(options.out_dir, '.parts')
+    return options
 
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
 
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
+def main():
+    options = parse_args()
+    os.makedirs(options.parts_dir, exist_ok=True)
 
-# Generate follows.csv from random pairings of users
+    with Pool(options.workers, initializer=init_worker, initargs=(options,)) as pool:
+        parts = pool.map(partial(write_chunk, options), plan(options), chunksize=1)
 
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+    stitch(options, parts)
 
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+if __name__ == '__main__':
+    main()
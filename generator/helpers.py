@@ -1,14 +1,123 @@
 """Support functions for CSV generation."""
 
+from bisect import bisect_left
 from datetime import datetime
-from random import uniform
+from itertools import accumulate
+from random import Random
 
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+# Splashbase header images, kept locally so generation runs offline
+HEADER_IMAGE_URLS = [
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh0n9pHJW1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh0uemhCk1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh121HEWa1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh17lfd9R1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh1d7s3UD1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh1jdFvHR1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh1uhYnog1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh25vNOvI1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh29fxz111st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mnh2m1hnS81st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo1h6tGOZf1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2wz2LTCs1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2x3aAnRH1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2x80NkDu1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2x9xqeef1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2xbk8JUK1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2xdqmle51st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2xfarCvW1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2xgqdEFn1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mo2xijE2nr1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopq4kHmAg1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopq69jlcS1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopq8fyQwI1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqamedKu1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqc3ZZcz1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqdfx05t1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqfpSTPN1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqhxFulr1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqj9QUeq1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mopqkkwK2M1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6rzyNlAN1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s1hAudo1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s32zb6l1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s4dzqHA1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s661UgK1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s7lR1lS1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6s995bvI1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6sasSvPZ1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mp6scv2xrZ1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6f50W261st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6gwrYvm1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6l06zXi1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6poZxE51st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6tjdFhf1st5lhmo1_1280.jpg",
+    "https://splashbase.s3.amazonaws.com/unsplash/regular/tumblr_mpp6w0dxAm1st5lhmo1_1280.jpg",
+]
 
-    now = datetime.now()
+# Profile images: randomuser.me portraits by kind and count
+IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
+
+
+def get_random_datetime(year_gap=2, rng=None, now=None):
+    """Get a random datetime within the last few years.
+
+    Pass `rng` (a `random.Random`) and a fixed `now` for reproducible output.
+    """
+
+    rng = rng or Random()
+    now = now or datetime.now()
     then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+    random_timestamp = rng.uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+class PopularitySampler:
+    """Pick user ids with a power-law (Zipf) popularity distribution.
+
+    Users 1..num_users are shuffled into popularity ranks with `seed`, and
+    rank r is chosen with weight 1 / r ** skew, so a few accounts gather most
+    of the followers. Memory is O(num_users); sampling is O(log num_users).
+    """
+
+    def __init__(self, num_users, skew=1.0, seed=0):
+        ranked = list(range(1, num_users + 1))
+        Random(seed).shuffle(ranked)
+
+        self.ranked = ranked
+        self.cum_weights = list(
+            accumulate(1 / rank**skew for rank in range(1, num_users + 1))
+        )
+        self.total = self.cum_weights[-1]
+
+    def sample(self, rng):
+        """Return one user id."""
+
+        index = bisect_left(self.cum_weights, rng.random() * self.total)
+        return self.ranked[min(index, len(self.ranked) - 1)]
+
+    def sample_distinct(self, rng, k, exclude):
+        """Return up to `k` distinct user ids, none equal to `exclude`."""
+
+        k = min(k, len(self.ranked) - 1)
+        chosen = set()
+        attempts = 0
+
+        while len(chosen) < k and attempts < k * 20:
+            user_id = self.sample(rng)
+            if user_id != exclude:
+                chosen.add(user_id)
+            attempts += 1
+
+        # very skewed weights can starve the tail; top up uniformly
+        while len(chosen) < k:
+            user_id = rng.randint(1, len(self.ranked))
+            if user_id != exclude:
+                chosen.add(user_id)
+
+        return chosen
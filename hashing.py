@@ -0,0 +1,84 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow, and running it on the request thread means a
+burst of logins pins every worker. `PasswordHasher` runs it on a small
+thread pool instead (bcrypt releases the GIL while hashing), caps how many
+hashes may be queued, and knows when a stored hash was made at a different
+cost than the configured one so it can be upgraded on the next login.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+from flask_bcrypt import Bcrypt
+
+
+class HasherBusy(RuntimeError):
+    """Raised when too many hashes are already waiting for the pool."""
+
+
+class PasswordHasher:
+    """bcrypt hashing and checking on a bounded thread pool.
+
+    - rounds: bcrypt work factor (log2 of the iteration count)
+    - max_workers: hashes computed at once
+    - max_pending: hashes allowed to wait for a worker before callers are
+      refused with `HasherBusy`
+    - timeout: seconds a caller waits for a queue slot
+    """
+
+    def __init__(self, rounds=12, max_workers=4, max_pending=64, timeout=10):
+        self.configure(rounds, max_workers, max_pending, timeout)
+
+    def init_app(self, app):
+        """Configure from BCRYPT_LOG_ROUNDS and the PASSWORD_HASH_* settings."""
+
+        self.configure(
+            rounds=app.config.get("BCRYPT_LOG_ROUNDS", self.rounds),
+            max_workers=app.config.get("PASSWORD_HASH_WORKERS", self.max_workers),
+            max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING", self.max_pending),
+            timeout=app.config.get("PASSWORD_HASH_TIMEOUT", self.timeout),
+        )
+
+    def configure(self, rounds, max_workers, max_pending, timeout):
+        """(Re)build the pool with new settings."""
+
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._bcrypt = Bcrypt()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+        self._slots = BoundedSemaphore(max_workers + max_pending)
+
+    def _run(self, fn, *args):
+        """Run `fn(*args)` on the pool and wait for its result."""
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy("Too many password hashes in progress.")
+
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` at the configured cost."""
+
+        hashed = self._run(self._bcrypt.generate_password_hash, password, self.rounds)
+        return hashed.decode("UTF-8")
+
+    def check(self, hashed, password):
+        """Does `password` match the stored `hashed`?"""
+
+        return self._run(self._bcrypt.check_password_hash, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made at a different cost than the configured one?"""
+
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
@@ -0,0 +1,124 @@
+"""Schema migrations for databases created before the current models.
+
+`db.create_all()` only creates missing tables; it never adds a column or an
+index to a table that already exists. `upgrade` runs each migration in
+MIGRATIONS that isn't yet recorded in `schema_migrations`, in order, and
+records it. Every step is written to be safe to re-run (IF NOT EXISTS), so
+a database that is already partly up to date upgrades cleanly.
+
+Run it with `flask db-upgrade`. Add new migrations to the end of the list;
+never reorder or rename applied ones.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.schema import CreateIndex
+
+from models import db, User
+
+
+schema_migrations = db.Table(
+    "schema_migrations",
+    db.Column("version", db.Text, primary_key=True),
+    db.Column("applied_at", db.DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def create_tables():
+    """Create any tables that don't exist yet (with their indexes)."""
+
+    db.create_all()
+
+
+# (table, column, definition) for columns added since the first schema
+ADDED_COLUMNS = [
+    ("users", "messages_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("users", "following_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("users", "followers_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("users", "likes_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("users", "deleted_at", "TIMESTAMP WITHOUT TIME ZONE"),
+    ("users", "updated_at", "TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()"),
+    ("likes", "timestamp", "TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()"),
+]
+
+
+def add_columns():
+    """Add the counter, versioning and soft-delete columns, then fill the
+    counters in."""
+
+    for table, column, definition in ADDED_COLUMNS:
+        db.session.execute(
+            db.text(
+                f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "{column}" {definition}'
+            )
+        )
+    User.recount_counters()
+
+
+def add_indexes():
+    """Build the secondary indexes the models declare.
+
+    On PostgreSQL they're built CONCURRENTLY so the tables stay writable
+    meanwhile; that can't run inside a transaction, so each one gets its
+    own autocommit statement. A build that failed half way leaves an
+    invalid index behind, which is dropped and rebuilt.
+    """
+
+    engine = db.engine
+    concurrently = engine.dialect.name == "postgresql"
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in db.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if concurrently and conn.execute(
+                    db.text(
+                        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = indexrelid"
+                        " WHERE relname = :name AND NOT indisvalid"
+                    ),
+                    {"name": index.name},
+                ).first():
+                    conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY {index.name}")
+
+                sql = str(
+                    CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)
+                )
+                if concurrently:
+                    sql = sql.replace("INDEX", "INDEX CONCURRENTLY", 1)
+                conn.exec_driver_sql(sql)
+
+
+# (version, migration), oldest first
+MIGRATIONS = [
+    ("0001_create_tables", create_tables),
+    ("0002_counters_versions_soft_delete", add_columns),
+    ("0003_secondary_indexes", add_indexes),
+]
+
+
+def applied_versions():
+    """Versions already recorded in `schema_migrations`."""
+
+    schema_migrations.create(db.engine, checkfirst=True)
+    return set(
+        db.session.execute(db.select(schema_migrations.c.version)).scalars().all()
+    )
+
+
+def upgrade(progress=print):
+    """Apply the pending migrations in order; returns their versions."""
+
+    done = applied_versions()
+    # a transaction left open here would block CREATE INDEX CONCURRENTLY
+    db.session.commit()
+    applied = []
+
+    for version, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        progress(f"applying {version}")
+        migrate()
+        db.session.execute(schema_migrations.insert().values(version=version))
+        db.session.commit()
+        applied.append(version)
+
+    return applied
@@ -1,12 +1,14 @@
 """SQLAlchemy models for Warbler."""
 
+import re
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+from hashing import PasswordHasher
+from pagination import PER_PAGE, paginate
+from replica import RoutingSQLAlchemy
 
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+hasher = PasswordHasher()
+db = RoutingSQLAlchemy()
 
 
 class Follows(db.Model):
@@ -26,6 +28,45 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    @classmethod
+    def exists(cls, follower_id, followed_id):
+        """Is `follower_id` following `followed_id`? One primary-key lookup."""
+
+        return db.session.query(
+            db.exists().where(
+                cls.user_being_followed_id == followed_id,
+                cls.user_following_id == follower_id,
+            )
+        ).scalar()
+
+    @classmethod
+    def followed_ids_among(cls, follower_id, user_ids):
+        """Return the set of `user_ids` that `follower_id` follows."""
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        rows = db.session.query(cls.user_being_followed_id).filter(
+            cls.user_following_id == follower_id,
+            cls.user_being_followed_id.in_(user_ids),
+        )
+        return {user_id for (user_id,) in rows}
+
+    @classmethod
+    def follower_ids_among(cls, followed_id, user_ids):
+        """Return the set of `user_ids` that follow `followed_id`."""
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        rows = db.session.query(cls.user_following_id).filter(
+            cls.user_being_followed_id == followed_id,
+            cls.user_following_id.in_(user_ids),
+        )
+        return {user_id for (user_id,) in rows}
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -40,8 +81,68 @@ class Likes(db.Model):
         db.Integer, db.ForeignKey("messages.id", ondelete="cascade"), primary_key=True
     )
 
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    @classmethod
+    def message_ids_for(cls, user_id, message_ids):
+        """Return the set of `message_ids` that `user_id` has liked.
+
+        One primary-key lookup per page, so templates can check likes with
+        `msg.id in liked_ids` instead of scanning `user.likes`.
+        """
+
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+
+        rows = db.session.query(cls.message_id).filter(
+            cls.user_id == user_id, cls.message_id.in_(message_ids)
+        )
+        return {message_id for (message_id,) in rows}
+
+
+class UserLookupsMixin:
+    """Follow and like lookups that only need the user's `id`.
+
+    Shared by `User` and the cached `CurrentUser` snapshot.
+    """
+
+    __slots__ = ()
+
+    def liked_message_ids(self, messages):
+        """Return the ids of those `messages` this user has liked."""
+
+        return Likes.message_ids_for(self.id, (msg.id for msg in messages))
 
-class User(db.Model):
+    def is_followed_by(self, other_user):
+        """Is this user followed by `other_user`?"""
+
+        return Follows.exists(other_user.id, self.id)
+
+    def is_following(self, other_user):
+        """Is this user following `other_use`?"""
+
+        return Follows.exists(self.id, other_user.id)
+
+    def following_ids_among(self, user_ids):
+        """Return the set of `user_ids` this user follows.
+
+        Answers a whole page of user cards in one query.
+        """
+
+        return Follows.followed_ids_among(self.id, user_ids)
+
+    def followed_by_ids_among(self, user_ids):
+        """Return the set of `user_ids` that follow this user."""
+
+        return Follows.follower_ids_among(self.id, user_ids)
+
+
+class User(UserLookupsMixin, db.Model):
     """User in the system."""
 
     __tablename__ = "users"
@@ -83,6 +184,50 @@ class User(db.Model):
         nullable=False,
     )
 
+    # denormalized counts, kept up to date by the write paths in app.py;
+    # `flask reconcile-counters` recomputes them if they ever drift
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    COUNTERS = ("messages_count", "following_count", "followers_count", "likes_count")
+
+    # set when the account is deleted; purge.py removes the rows afterwards
+    deleted_at = db.Column(db.DateTime)
+
+    # row version for HTTP validators: bumped by profile edits and whenever
+    # a counter changes, i.e. whenever anything shown about the user does
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=db.func.now(),
+    )
+
     messages = db.relationship("Message")
 
     followers = db.relationship(
@@ -104,17 +249,141 @@ class User(db.Model):
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
-    def is_followed_by(self, other_user):
-        """Is this user followed by `other_user`?"""
+    @classmethod
+    def adjust_counters(cls, user_ids, **deltas):
+        """Add `deltas` to the counters of `user_ids`, in the current transaction.
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        `user_ids` is a single id or a select of ids, e.g.
+        `User.adjust_counters(user.id, following_count=1)`. The update is done
+        in SQL so concurrent writes can't lose an increment.
+        """
 
-    def is_following(self, other_user):
-        """Is this user following `other_use`?"""
+        if isinstance(user_ids, int):
+            where = cls.id == user_ids
+        else:
+            where = cls.id.in_(user_ids)
+
+        values = {name: getattr(cls, name) + delta for name, delta in deltas.items()}
+        values["updated_at"] = datetime.utcnow()
+        db.session.execute(
+            db.update(cls)
+            .where(where)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    def active(cls):
+        """Query of users whose accounts haven't been deleted."""
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def following_of(cls, user_id):
+        """Query of the active users `user_id` follows, by id."""
+
+        return (
+            cls.active()
+            .join(Follows, Follows.user_being_followed_id == cls.id)
+            .filter(Follows.user_following_id == user_id)
+            .order_by(cls.id)
+        )
+
+    @classmethod
+    def followers_of(cls, user_id):
+        """Query of the active users following `user_id`, by id."""
+
+        return (
+            cls.active()
+            .join(Follows, Follows.user_following_id == cls.id)
+            .filter(Follows.user_being_followed_id == user_id)
+            .order_by(cls.id)
+        )
+
+    @classmethod
+    def actual_counts(cls):
+        """Counter values recomputed from `messages`, `follows` and `likes`.
+
+        Returns `{counter: subquery}`, each subquery having a `user_id` and
+        `n` column, aggregated in one pass over its table.
+        """
+
+        def count(column):
+            return (
+                db.select(column.label("user_id"), db.func.count().label("n"))
+                .group_by(column)
+                .subquery()
+            )
+
+        return {
+            "messages_count": count(Message.user_id),
+            "following_count": count(Follows.user_following_id),
+            "followers_count": count(Follows.user_being_followed_id),
+            "likes_count": count(Likes.user_id),
+        }
+
+    @classmethod
+    def recount_counters(cls):
+        """Set every user's counters to the real counts, in one statement.
+
+        Only rows whose counters differ are written. Returns the number of
+        users updated.
+        """
+
+        users = cls.__table__.alias("counted")
+        query = db.select(users.c.id.label("user_id"))
+        from_ = users
+        for name, counts in cls.actual_counts().items():
+            from_ = from_.outerjoin(counts, counts.c.user_id == users.c.id)
+            query = query.add_columns(db.func.coalesce(counts.c.n, 0).label(name))
+        actual = query.select_from(from_).subquery()
+
+        return db.session.execute(
+            db.update(cls)
+            .where(
+                cls.id == actual.c.user_id,
+                db.or_(
+                    *(getattr(cls, name) != actual.c[name] for name in cls.COUNTERS)
+                ),
+            )
+            .values(
+                updated_at=datetime.utcnow(),
+                **{name: actual.c[name] for name in cls.COUNTERS},
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    @classmethod
+    def reconcile_counters(cls, fix=True, batch_size=1000):
+        """Compare every user's counters with the real counts.
+
+        Returns a list of `(user_id, counter, stored, actual)` for each counter
+        that had drifted, and corrects them unless `fix` is False. Meant for
+        spotting drift; to just recompute them all, use `recount_counters`.
+        """
+
+        query = db.session.query(cls.id)
+        drifted = []
+
+        for name, counts in cls.actual_counts().items():
+            actual = db.func.coalesce(counts.c.n, 0)
+            query = query.outerjoin(counts, counts.c.user_id == cls.id).add_columns(
+                getattr(cls, name), actual
+            )
+            drifted.append(getattr(cls, name) != actual)
+
+        drift = []
+        rows = query.filter(db.or_(*drifted)).order_by(cls.id).yield_per(batch_size)
+        for user_id, *counts in rows:
+            stored, real = counts[0::2], counts[1::2]
+            for name, was, now in zip(cls.COUNTERS, stored, real):
+                if was != now:
+                    drift.append((user_id, name, was, now))
+
+        if fix and drift:
+            cls.recount_counters()
+
+        return drift
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -123,7 +392,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode("UTF-8")
+        hashed_pwd = hasher.hash(password)
 
         user = User(
             username=username,
@@ -144,18 +413,62 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash was made at a different bcrypt cost than the one
+        configured now, it is replaced with a fresh hash; commit to keep it.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.active().filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = hasher.check(user.password, password)
             if is_auth:
+                if hasher.needs_rehash(user.password):
+                    user.password = hasher.hash(password)
                 return user
 
         return False
 
 
+class CurrentUser(UserLookupsMixin):
+    """Lightweight, cacheable snapshot of the logged-in user.
+
+    Holds what the page chrome needs (no password hash or bio). Views that
+    change the user load the full `User` instead.
+    """
+
+    __slots__ = (
+        "id",
+        "username",
+        "image_url",
+        "header_image_url",
+        "messages_count",
+        "following_count",
+        "followers_count",
+        "likes_count",
+        "updated_at",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
+
+    @classmethod
+    def load(cls, user_id):
+        """Read a snapshot of `user_id` from the database, or None."""
+
+        columns = [getattr(User, name) for name in cls.__slots__]
+        row = (
+            db.session.query(*columns)
+            .filter(User.id == user_id, User.deleted_at.is_(None))
+            .first()
+        )
+        return cls(**row._asdict()) if row else None
+
+
 class Message(db.Model):
     """An individual message ("warble")."""
 
@@ -174,7 +487,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -185,6 +498,402 @@ class Message(db.Model):
 
     user = db.relationship("User")
 
+    @classmethod
+    def visible(cls):
+        """Query of messages whose authors haven't deleted their accounts."""
+
+        return cls.query.join(User, User.id == cls.user_id).filter(
+            User.deleted_at.is_(None)
+        )
+
+    @classmethod
+    def page_by_author(cls, user_id, before=None, after=None):
+        """Return a `Page` of the messages written by `user_id`."""
+
+        return paginate(
+            cls.query.filter(cls.user_id == user_id),
+            (cls.timestamp, cls.id),
+            key=lambda msg: (msg.timestamp, msg.id),
+            before=before,
+            after=after,
+        )
+
+    @classmethod
+    def page_liked_by(cls, user_id, before=None, after=None):
+        """Return a `Page` of the messages liked by `user_id`, newest like first.
+
+        Reads only `user_id`'s rows in `likes`, with each message's author
+        loaded in the same query; messages by deleted accounts are left out.
+        """
+
+        query = (
+            db.session.query(cls, Likes.timestamp)
+            .join(Likes, Likes.message_id == cls.id)
+            .join(User, User.id == cls.user_id)
+            .options(db.contains_eager(cls.user))
+            .filter(Likes.user_id == user_id, User.deleted_at.is_(None))
+        )
+        page = paginate(
+            query,
+            (Likes.timestamp, Likes.message_id),
+            key=lambda row: (row.timestamp, row.Message.id),
+            before=before,
+            after=after,
+        )
+        page.items = [row.Message for row in page.items]
+        return page
+
+
+class TimelineEntry(db.Model):
+    """A message fanned out to one user's home timeline.
+
+    Rows are written when a message is posted (one per follower, plus the
+    author) so a home page is a single range read over
+    `(user_id, timestamp)` instead of an `IN` query over `messages`.
+    """
+
+    __tablename__ = "timeline_entries"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="cascade"), primary_key=True
+    )
+
+    message_id = db.Column(
+        db.Integer, db.ForeignKey("messages.id", ondelete="cascade"), primary_key=True
+    )
+
+    # copied from the message so the timeline index can be read in order
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    # most of a newly followed author's messages copied onto a timeline
+    FOLLOW_BACKFILL = PER_PAGE * 10
+
+    @classmethod
+    def page_for(cls, user_id, before=None, after=None):
+        """Return a `Page` of the messages on `user_id`'s timeline.
+
+        Authors are loaded in the same query; messages by deleted accounts
+        are left out while their purge catches up.
+        """
+
+        query = (
+            Message.query.join(cls, cls.message_id == Message.id)
+            .join(User, User.id == Message.user_id)
+            .options(db.contains_eager(Message.user))
+            .filter(cls.user_id == user_id, User.deleted_at.is_(None))
+        )
+        return paginate(
+            query,
+            (cls.timestamp, cls.message_id),
+            key=lambda msg: (msg.timestamp, msg.id),
+            before=before,
+            after=after,
+        )
+
+    @classmethod
+    def fan_out(cls, message):
+        """Add `message` to its author's timeline and every follower's.
+
+        The message must already be flushed so it has an id and timestamp.
+        """
+
+        followers = db.select(
+            Follows.user_following_id,
+            db.literal(message.id),
+            db.literal(message.timestamp),
+        ).where(Follows.user_being_followed_id == message.user_id)
+        author = db.select(
+            db.literal(message.user_id),
+            db.literal(message.id),
+            db.literal(message.timestamp),
+        )
+
+        db.session.execute(
+            db.insert(cls).from_select(
+                ["user_id", "message_id", "timestamp"], followers.union_all(author)
+            )
+        )
+
+    @classmethod
+    def add_author(cls, user_id, author_id, limit=FOLLOW_BACKFILL):
+        """Copy `author_id`'s latest `limit` messages onto `user_id`'s timeline.
+
+        Used when `user_id` starts following `author_id`, inside the request,
+        so it's capped: a follow of a prolific author stays a bounded insert.
+        Messages already on the timeline are skipped.
+        """
+
+        latest = (
+            db.select(Message.id, Message.timestamp)
+            .where(Message.user_id == author_id)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit)
+            .subquery()
+        )
+        already_there = db.select(cls.message_id).where(
+            cls.user_id == user_id, cls.message_id == latest.c.id
+        )
+        messages = db.select(
+            db.literal(user_id), latest.c.id, latest.c.timestamp
+        ).where(~already_there.exists())
+
+        db.session.execute(
+            db.insert(cls).from_select(
+                ["user_id", "message_id", "timestamp"], messages
+            )
+        )
+
+    @classmethod
+    def remove_author(cls, user_id, author_id):
+        """Drop every message by `author_id` from `user_id`'s timeline."""
+
+        authored = db.select(Message.id).where(Message.user_id == author_id)
+        db.session.execute(
+            db.delete(cls)
+            .where(cls.user_id == user_id, cls.message_id.in_(authored))
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    def remove_message(cls, message_id):
+        """Drop `message_id` from every timeline it was fanned out to."""
+
+        db.session.execute(db.delete(cls).where(cls.message_id == message_id))
+
+    @classmethod
+    def backfill(cls):
+        """Rebuild every timeline from `follows` and `messages`.
+
+        Returns the number of timeline entries written.
+        """
+
+        followed = db.select(
+            Follows.user_following_id, Message.id, Message.timestamp
+        ).join(Follows, Follows.user_being_followed_id == Message.user_id)
+        own = db.select(Message.user_id, Message.id, Message.timestamp)
+
+        db.session.execute(db.delete(cls))
+        result = db.session.execute(
+            db.insert(cls).from_select(
+                ["user_id", "message_id", "timestamp"], followed.union_all(own)
+            )
+        )
+        return result.rowcount
+
+
+def trigrams(text, whole=False, pad=True):
+    """Return the set of lowercase three-letter grams in `text`.
+
+    Words are padded like pg_trgm ("  ab " -> "  a", " ab", "ab ") so
+    grams also mark where a word starts and ends. With `whole`, the text is
+    one word (usernames); otherwise it's split on non-word characters.
+    """
+
+    text = text.lower()
+    words = [text] if whole else re.findall(r"\w+", text)
+    grams = set()
+
+    for word in words:
+        if pad:
+            word = f"  {word} "
+        grams.update(word[i : i + 3] for i in range(len(word) - 2))
+
+    return grams
+
+
+class UserSearchGram(db.Model):
+    """Inverted trigram index over usernames, bios and locations.
+
+    Lets user search find `%q%`-style matches through the primary-key index
+    instead of scanning `users` with a leading-wildcard LIKE.
+    """
+
+    __tablename__ = "user_search_grams"
+
+    USERNAME_WEIGHT = 3
+    PROFILE_WEIGHT = 1
+
+    gram = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="cascade"), primary_key=True
+    )
+
+    # summed over the fields the gram appears in; username grams count most
+    weight = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    in_username = db.Column(
+        db.Boolean,
+        nullable=False,
+    )
+
+    @classmethod
+    def rows_for(cls, user):
+        """Build the index rows (as dicts) for `user`."""
+
+        weights = {}
+        username_grams = trigrams(user.username, whole=True)
+
+        for gram in username_grams:
+            weights[gram] = cls.USERNAME_WEIGHT
+        for text in (user.bio, user.location):
+            for gram in trigrams(text or ""):
+                weights[gram] = weights.get(gram, 0) + cls.PROFILE_WEIGHT
+
+        return [
+            dict(
+                gram=gram,
+                user_id=user.id,
+                weight=weight,
+                in_username=gram in username_grams,
+            )
+            for gram, weight in weights.items()
+        ]
+
+    @classmethod
+    def index_user(cls, user):
+        """(Re)index `user`; call after signup or a profile change."""
+
+        cls.remove_user(user.id)
+        rows = cls.rows_for(user)
+        if rows:
+            db.session.execute(db.insert(cls), rows)
+
+    @classmethod
+    def remove_user(cls, user_id):
+        """Take `user_id` out of the index."""
+
+        db.session.execute(db.delete(cls).where(cls.user_id == user_id))
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Rebuild the whole index from `users`; returns users indexed."""
+
+        db.session.execute(db.delete(cls))
+
+        columns = (User.id, User.username, User.bio, User.location)
+        query = (
+            db.session.query(*columns)
+            .filter(User.deleted_at.is_(None))
+            .order_by(User.id)
+        )
+        count = 0
+        rows = []
+
+        for user in query.yield_per(batch_size):
+            rows.extend(cls.rows_for(user))
+            count += 1
+            if len(rows) >= batch_size:
+                db.session.execute(db.insert(cls), rows)
+                rows = []
+
+        if rows:
+            db.session.execute(db.insert(cls), rows)
+        return count
+
+    @classmethod
+    def search(cls, q, limit=60):
+        """Return up to `limit` users matching `q`, best match first.
+
+        Users are ranked by the weight of the query's grams they contain and
+        must contain at least half of them. Queries shorter than three letters
+        fall back to username prefix matching.
+        """
+
+        grams = trigrams(q, whole=True, pad=False)
+        if not grams:
+            return cls.autocomplete(q, limit=limit)
+
+        matched = db.func.count(cls.gram)
+        score = db.func.sum(cls.weight)
+        ranked = (
+            db.session.query(cls.user_id, score)
+            .filter(cls.gram.in_(grams))
+            .group_by(cls.user_id)
+            .having(matched >= (len(grams) + 1) // 2)
+            .order_by(score.desc(), cls.user_id)
+            .limit(limit)
+            .all()
+        )
+
+        users = User.query.filter(User.id.in_([user_id for user_id, _ in ranked]))
+        by_id = {user.id: user for user in users}
+        return [by_id[user_id] for user_id, _ in ranked if user_id in by_id]
+
+    @classmethod
+    def autocomplete(cls, prefix, limit=10):
+        """Return up to `limit` users whose username starts with `prefix`."""
+
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        # every gram of the padded prefix except those touching its end
+        word = f"  {prefix}"
+        grams = {word[i : i + 3] for i in range(len(word) - 2)}
+
+        candidates = (
+            db.select(cls.user_id)
+            .where(cls.gram.in_(grams), cls.in_username)
+            .group_by(cls.user_id)
+            .having(db.func.count(cls.gram) == len(grams))
+        )
+        escaped = re.sub(r"([\\%_])", r"\\\1", prefix)
+        return (
+            User.query.filter(
+                User.id.in_(candidates),
+                db.func.lower(User.username).like(f"{escaped}%", escape="\\"),
+            )
+            .order_by(db.func.length(User.username), User.username)
+            .limit(limit)
+            .all()
+        )
+
+
+db.Index(
+    "ix_likes_user_id_timestamp",
+    Likes.user_id,
+    Likes.timestamp.desc(),
+    Likes.message_id.desc(),
+)
+
+db.Index(
+    "ix_timeline_entries_user_id_timestamp",
+    TimelineEntry.user_id,
+    TimelineEntry.timestamp.desc(),
+    TimelineEntry.message_id.desc(),
+)
+
+# a user's messages newest first, for profiles and the timeline backfill
+db.Index(
+    "ix_messages_user_id_timestamp",
+    Message.user_id,
+    Message.timestamp.desc(),
+    Message.id.desc(),
+)
+
+# follows by follower; the primary key only serves lookups by followed user
+db.Index(
+    "ix_follows_user_following_id",
+    Follows.user_following_id,
+    Follows.user_being_followed_id,
+)
+
+# likes of a message, e.g. when it's deleted; the primary key leads with user
+db.Index("ix_likes_message_id", Likes.message_id)
+
+# a deleted message's timeline entries, likewise
+db.Index("ix_timeline_entries_message_id", TimelineEntry.message_id)
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
@@ -194,3 +903,4 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
+    hasher.init_app(app)
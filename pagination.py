@@ -0,0 +1,106 @@
+"""Keyset (cursor) pagination for Warbler's message lists.
+
+Pages are cut on a `(timestamp, id)` pair rather than with OFFSET, so the
+database seeks straight to the cursor through an index and page 1000 costs
+the same as page 1.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+PER_PAGE = 100
+
+
+def encode_cursor(timestamp, id):
+    """Turn a `(timestamp, id)` sort key into an opaque URL-safe string."""
+
+    raw = f"{timestamp.isoformat()}|{id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into a `(timestamp, id)` sort key.
+
+    Returns None if the cursor is missing or malformed.
+    """
+
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii")
+        timestamp, id = raw.split("|")
+        return (datetime.fromisoformat(timestamp), int(id))
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+class Page:
+    """One page of results, with cursors to the pages either side of it.
+
+    `older` and `newer` are None when there is nothing further that way.
+    """
+
+    def __init__(self, items, older=None, newer=None):
+        self.items = items
+        self.older = older
+        self.newer = newer
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def paginate(query, columns, key, before=None, after=None, per_page=PER_PAGE):
+    """Return a `Page` of `query`, newest first.
+
+    - columns: the `(timestamp, id)` columns the query is ordered by
+    - key: function giving the `(timestamp, id)` of a result row
+    - before: cursor; return the page just older than it
+    - after: cursor; return the page just newer than it
+
+    With neither cursor the newest page is returned.
+    """
+
+    timestamp_col, id_col = columns
+    sort_key = tuple_(timestamp_col, id_col)
+    before = decode_cursor(before)
+    after = decode_cursor(after)
+
+    if after:
+        rows = (
+            query.filter(sort_key > after)
+            .order_by(timestamp_col.asc(), id_col.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        more_newer = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_older, has_newer = True, more_newer
+
+    else:
+        if before:
+            query = query.filter(sort_key < before)
+        rows = (
+            query.order_by(timestamp_col.desc(), id_col.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        items = rows[:per_page]
+        has_older, has_newer = len(rows) > per_page, before is not None
+
+    if not items:
+        return Page(items)
+
+    return Page(
+        items,
+        older=encode_cursor(*key(items[-1])) if has_older else None,
+        newer=encode_cursor(*key(items[0])) if has_newer else None,
+    )
@@ -0,0 +1,112 @@
+"""In-process publish/subscribe for live timeline updates.
+
+Each open live connection (see `timeline_stream` in app.py) subscribes for
+its user and gets a small bounded queue; `publish` drops an event into the
+queues of the users it's for. A connection that falls behind isn't allowed
+to grow its buffer: its subscription is marked `overflowed` and it's told
+to reload instead. A cap on subscribers keeps the threads parked on these
+connections bounded too.
+
+The hub only sees messages posted through this process, so with several
+workers a message reaches only the live connections on the worker that
+took the post; the rest pick it up on their next reload.
+"""
+
+import queue
+from collections import defaultdict
+from threading import Lock
+
+
+class HubFull(Exception):
+    """Raised when the subscriber cap is reached."""
+
+
+class Subscription:
+    """One live connection's view of the hub."""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Next event, or None if none arrived within `timeout` seconds."""
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Hub:
+    """Fans published events out to the subscriptions of their users.
+
+    LIVE_MAX_SUBSCRIBERS caps open subscriptions across the process, and
+    LIVE_QUEUE_SIZE the events buffered per subscription.
+    """
+
+    def __init__(self):
+        self.max_subscribers = 1000
+        self.queue_size = 50
+        self._subscriptions = defaultdict(set)
+        self._count = 0
+        self._lock = Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("LIVE_MAX_SUBSCRIBERS", 1000)
+        app.config.setdefault("LIVE_QUEUE_SIZE", 50)
+        self.max_subscribers = app.config["LIVE_MAX_SUBSCRIBERS"]
+        self.queue_size = app.config["LIVE_QUEUE_SIZE"]
+
+    def subscribe(self, user_id):
+        """Open a `Subscription` for `user_id`; raises `HubFull` at the cap."""
+
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise HubFull()
+            subscription = Subscription(user_id, self.queue_size)
+            self._subscriptions[user_id].add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscriber_ids(self):
+        """Ids of the users with an open subscription."""
+
+        with self._lock:
+            return set(self._subscriptions)
+
+    def publish(self, user_ids, event):
+        """Queue `event` for every subscription of `user_ids`."""
+
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in targets:
+            subscription.put(event)
+
+    def stats(self):
+        """`{"subscribers": n, "users": n}` for monitoring."""
+
+        with self._lock:
+            return {"subscribers": self._count, "users": len(self._subscriptions)}
+
+
+hub = Hub()
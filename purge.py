@@ -0,0 +1,236 @@
+"""Background purging of deleted accounts.
+
+`delete_user` only marks the account deleted (`User.deleted_at`) and hides
+it; `AccountPurger` then removes its follows, messages, likes and timeline
+rows in chunks. Each chunk is one short transaction of set-based
+statements, so no request waits on the purge and no lock is held for long.
+Each step deletes exactly what it has processed, so a purge that is
+interrupted (a restart, a crash) resumes where it stopped when run again:
+`flask purge-deleted-users` picks up every pending one.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db, User, Message, Likes, Follows, TimelineEntry, UserSearchGram
+
+
+logger = logging.getLogger(__name__)
+
+
+def purge_following(user_id, batch_size):
+    """Drop a chunk of the follows `user_id` made; returns rows deleted."""
+
+    followed = (
+        db.session.execute(
+            db.select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == user_id)
+            .limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    if followed:
+        User.adjust_counters(followed, followers_count=-1)
+        db.session.execute(
+            db.delete(Follows).where(
+                Follows.user_following_id == user_id,
+                Follows.user_being_followed_id.in_(followed),
+            )
+        )
+    return len(followed)
+
+
+def purge_followers(user_id, batch_size):
+    """Drop a chunk of the follows of `user_id`; returns rows deleted."""
+
+    followers = (
+        db.session.execute(
+            db.select(Follows.user_following_id)
+            .where(Follows.user_being_followed_id == user_id)
+            .limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    if followers:
+        User.adjust_counters(followers, following_count=-1)
+        db.session.execute(
+            db.delete(Follows).where(
+                Follows.user_being_followed_id == user_id,
+                Follows.user_following_id.in_(followers),
+            )
+        )
+    return len(followers)
+
+
+def purge_messages(user_id, batch_size):
+    """Drop a chunk of `user_id`'s messages, with their likes and timeline
+    entries; returns messages deleted."""
+
+    message_ids = (
+        db.session.execute(
+            db.select(Message.id)
+            .where(Message.user_id == user_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    if not message_ids:
+        return 0
+
+    # a liker may have liked several messages in the chunk
+    likers = (
+        db.select(Likes.user_id, db.func.count().label("n"))
+        .where(Likes.message_id.in_(message_ids))
+        .group_by(Likes.user_id)
+        .subquery()
+    )
+    db.session.execute(
+        db.update(User)
+        .where(User.id == likers.c.user_id)
+        .values(
+            likes_count=User.likes_count - likers.c.n, updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    for model, column in [
+        (TimelineEntry, TimelineEntry.message_id),
+        (Likes, Likes.message_id),
+        (Message, Message.id),
+    ]:
+        db.session.execute(
+            db.delete(model)
+            .where(column.in_(message_ids))
+            .execution_options(synchronize_session=False)
+        )
+    return len(message_ids)
+
+
+def purge_likes(user_id, batch_size):
+    """Drop a chunk of the likes `user_id` made; returns rows deleted."""
+
+    liked = (
+        db.select(Likes.message_id).where(Likes.user_id == user_id).limit(batch_size)
+    )
+    return db.session.execute(
+        db.delete(Likes)
+        .where(Likes.user_id == user_id, Likes.message_id.in_(liked))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def purge_timeline(user_id, batch_size):
+    """Drop a chunk of `user_id`'s own timeline; returns rows deleted."""
+
+    entries = (
+        db.select(TimelineEntry.message_id)
+        .where(TimelineEntry.user_id == user_id)
+        .limit(batch_size)
+    )
+    return db.session.execute(
+        db.delete(TimelineEntry)
+        .where(
+            TimelineEntry.user_id == user_id, TimelineEntry.message_id.in_(entries)
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# follows first, so lists and counters are right soonest, then messages so
+# they leave other users' timelines
+STEPS = [
+    ("following", purge_following),
+    ("followers", purge_followers),
+    ("messages", purge_messages),
+    ("likes", purge_likes),
+    ("timeline", purge_timeline),
+]
+
+
+def log_progress(user_id, step, done):
+    """Default `purge_user` progress report."""
+
+    logger.info("purging user #%s: %d %s removed", user_id, done, step)
+
+
+def purge_user(user_id, batch_size=1000, progress=log_progress):
+    """Remove a deleted account and everything it owns, chunk by chunk.
+
+    Commits after every chunk and calls `progress(user_id, step, done)`
+    with the running total for the step. Returns `{step: rows removed}`.
+    """
+
+    totals = {}
+
+    for step, purge_chunk in STEPS:
+        totals[step] = 0
+        while True:
+            removed = purge_chunk(user_id, batch_size)
+            db.session.commit()
+            if not removed:
+                break
+            totals[step] += removed
+            progress(user_id, step, totals[step])
+
+    # anything added since its step ran goes with the ondelete cascades
+    UserSearchGram.remove_user(user_id)
+    db.session.execute(db.delete(User).where(User.id == user_id))
+    db.session.commit()
+    progress(user_id, "account", 1)
+
+    return totals
+
+
+def pending_user_ids():
+    """Ids of accounts marked deleted but not yet purged."""
+
+    return (
+        db.session.execute(
+            db.select(User.id).where(User.deleted_at.isnot(None)).order_by(User.id)
+        )
+        .scalars()
+        .all()
+    )
+
+
+class AccountPurger:
+    """Runs `purge_user` on a background thread.
+
+    PURGE_BATCH_SIZE sets the rows per chunk; with PURGE_INLINE set (e.g.
+    in tests) purges run synchronously in the caller instead.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purge")
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("PURGE_BATCH_SIZE", 1000)
+        app.config.setdefault("PURGE_INLINE", False)
+
+    def submit(self, user_id):
+        """Purge `user_id` in the background (or now, if inline)."""
+
+        if self.app.config["PURGE_INLINE"]:
+            return purge_user(user_id, self.app.config["PURGE_BATCH_SIZE"])
+        return self._pool.submit(self._run, user_id)
+
+    def _run(self, user_id):
+        with self.app.app_context():
+            try:
+                return purge_user(user_id, self.app.config["PURGE_BATCH_SIZE"])
+            except Exception:
+                # the account stays marked; the next run resumes it
+                logger.exception("purge of user #%s failed", user_id)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+purger = AccountPurger()
@@ -0,0 +1,148 @@
+"""Per-request SQL query counting, timing and N+1 detection.
+
+Every statement any engine runs is reported to the collectors active in the
+current context: one per request (see `init_app`), plus any opened by
+`assert_max_queries` in tests. Statements are grouped by a fingerprint with
+literals and parameters stripped out, so the same lazy load fired once per
+row of a template loop shows up as one fingerprint repeated N times.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+_collectors = ContextVar("query_collectors", default=())
+
+# bound parameters in each DB-API paramstyle, and literal strings/numbers
+_VALUE = r"(?:%\(\w+\)s|%s|:\w+|\?|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b)"
+_VALUE_LIST = re.compile(rf"\(\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\)")
+_LITERAL = re.compile(_VALUE)
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Normalize `statement` so repeats differing only in values match."""
+
+    statement = _VALUE_LIST.sub("(?)", statement)
+    statement = _LITERAL.sub("?", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class QueryStats:
+    """The statements run while this collector was active."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold=2):
+        """`[(fingerprint, times)]` for statements run `threshold`+ times."""
+
+        return [
+            (fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold
+        ]
+
+
+def _push(stats):
+    """Make `stats` an active collector; returns a token to `reset` it."""
+
+    return _collectors.set(_collectors.get() + (stats,))
+
+
+@contextmanager
+def collect_queries():
+    """Collect stats for every statement run inside the block."""
+
+    stats = QueryStats()
+    token = _push(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+@contextmanager
+def assert_max_queries(n):
+    """Fail if the block runs more than `n` statements.
+
+    For tests: wrap a request to catch a route regressing into N+1 loads.
+    """
+
+    with collect_queries() as stats:
+        yield stats
+
+    if stats.count > n:
+        details = "\n".join(
+            f"  {times}x {fp}" for fp, times in stats.fingerprints.most_common()
+        )
+        raise AssertionError(
+            f"{stats.count} queries run, expected at most {n}:\n{details}"
+        )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    for stats in _collectors.get():
+        stats.record(statement, duration)
+
+
+def init_app(app):
+    """Collect query stats for each request of `app`.
+
+    Adds X-Query-Count and X-Query-Time headers when QUERY_STATS_HEADERS is
+    set, and logs a warning for any statement a request repeats at least
+    QUERY_STATS_REPEAT_THRESHOLD times (a likely N+1).
+    """
+
+    app.config.setdefault("QUERY_STATS_HEADERS", True)
+    app.config.setdefault("QUERY_STATS_REPEAT_THRESHOLD", 5)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+        g.query_stats_token = _push(g.query_stats)
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get("query_stats")
+        if stats is None:
+            return response
+
+        if app.config["QUERY_STATS_HEADERS"]:
+            response.headers["X-Query-Count"] = str(stats.count)
+            response.headers["X-Query-Time"] = f"{stats.duration * 1000:.1f}ms"
+
+        for fp, times in stats.repeated(app.config["QUERY_STATS_REPEAT_THRESHOLD"]):
+            logger.warning(
+                "possible N+1 in %s: %d runs of %s", request.endpoint, times, fp
+            )
+
+        return response
+
+    @app.teardown_request
+    def stop_query_stats(exc):
+        token = g.pop("query_stats_token", None)
+        if token is not None:
+            _collectors.reset(token)
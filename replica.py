@@ -0,0 +1,81 @@
+"""Routing reads to a read replica.
+
+When the "replica" bind is configured (REPLICA_DATABASE_URL), views marked
+`read_only` run their SELECTs against it; everything else, and anything
+flushed or written from those views, still goes to the primary. A replica
+lags the primary a little, so after a user's own write (any successful
+non-GET request) their reads stay on the primary for REPLICA_STICKY_SECONDS
+and they always see what they just did.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+
+REPLICA_BIND = "replica"
+STICKY_KEY = "primary_until"
+
+
+def replica_enabled(app):
+    """Is a replica configured for `app`?"""
+
+    return REPLICA_BIND in (app.config.get("SQLALCHEMY_BINDS") or {})
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends SELECTs to the replica inside `read_only` views."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if (
+            clause is not None
+            and clause.is_select
+            and not self._flushing
+            and has_app_context()
+            and g.get("read_replica")
+        ):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """`SQLAlchemy` whose sessions are `RoutingSession`s."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_only(view):
+    """Serve `view`'s reads from the replica, unless the user wrote lately."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = (
+            replica_enabled(current_app)
+            and session.get(STICKY_KEY, 0) < time.time()
+        )
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.read_replica = False
+
+    return wrapper
+
+
+def init_app(app):
+    """Pin a user's reads to the primary for a while after they write."""
+
+    app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if (
+            replica_enabled(app)
+            and request.method not in ("GET", "HEAD", "OPTIONS")
+            and response.status_code < 400
+        ):
+            session[STICKY_KEY] = time.time() + app.config["REPLICA_STICKY_SECONDS"]
+        return response
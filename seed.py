@@ -1,20 +1,229 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
+
+The CSVs are streamed in fixed-size batches, so datasets far bigger than
+memory load fine: on PostgreSQL each batch goes in with COPY, elsewhere with
+an executemany INSERT. Foreign keys (PostgreSQL only) and secondary indexes
+are dropped while the rows go in and recreated afterwards, then sequences
+are reset and the derived tables (timelines, counters, search index) are
+rebuilt.
+
+Run it like:
+
+    python seed.py [--data-dir generator] [--batch-size 10000]
+"""
+
+import argparse
+import csv
+import io
+import time
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Integer, inspect, text
+from sqlalchemy.schema import AddConstraint
 
-from csv import DictReader
 from app import db
-from models import User, Message, Follows
+from models import User, Message, Follows, TimelineEntry, UserSearchGram
+
+
+# loaded in this order so foreign keys are satisfied once they're restored
+CSV_TABLES = [
+    (User.__table__, "users.csv"),
+    (Message.__table__, "messages.csv"),
+    (Follows.__table__, "follows.csv"),
+]
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def read_batches(path, batch_size):
+    """Yield `(header, rows)` for each run of `batch_size` rows in a CSV."""
+
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        batch = []
+
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+
+        if batch:
+            yield header, batch
+
+
+def copy_batch(engine, table, header, rows):
+    """Load `rows` into `table` with PostgreSQL's COPY."""
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    quote = engine.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(name) for name in header)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote(table.name)} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def convert(column, value):
+    """Turn a CSV string into the Python value `column` expects."""
+
+    if value == "" and column.nullable:
+        return None
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Boolean):
+        return value.lower() in ("1", "t", "true")
+    return value
+
+
+def insert_batch(engine, table, header, rows):
+    """Load `rows` into `table` with one executemany INSERT."""
+
+    columns = [table.c[name] for name in header]
+    params = [
+        {column.name: convert(column, value) for column, value in zip(columns, row)}
+        for row in rows
+    ]
+    with engine.begin() as conn:
+        conn.execute(table.insert(), params)
+
+
+def load_table(engine, table, path, batch_size):
+    """Stream one CSV into `table`; returns `(rows, seconds)`."""
+
+    load_batch = copy_batch if engine.dialect.name == "postgresql" else insert_batch
+    count = 0
+    start = time.perf_counter()
+
+    for header, rows in read_batches(path, batch_size):
+        load_batch(engine, table, header, rows)
+        count += len(rows)
+
+    return count, time.perf_counter() - start
+
+
+def defer_constraints(engine, tables):
+    """Drop secondary indexes and (on PostgreSQL) foreign keys of `tables`.
+
+    Returns what was dropped so `restore_constraints` can put it back.
+    """
+
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    foreign_keys, indexes = [], []
+
+    for table in tables:
+        for index in table.indexes:
+            if not index.unique:
+                index.drop(engine)
+                indexes.append(index)
+
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                for fk in inspector.get_foreign_keys(table.name):
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {quote(table.name)} "
+                            f"DROP CONSTRAINT {quote(fk['name'])}"
+                        )
+                    )
+            foreign_keys.extend(table.foreign_key_constraints)
+
+    return foreign_keys, indexes
+
+
+def restore_constraints(engine, deferred):
+    """Recreate the indexes and foreign keys dropped by `defer_constraints`."""
+
+    foreign_keys, indexes = deferred
+
+    for index in indexes:
+        index.create(engine)
+
+    with engine.begin() as conn:
+        for fk in foreign_keys:
+            conn.execute(AddConstraint(fk))
+
+
+def reset_sequences(engine, tables):
+    """Point each serial id sequence past the largest loaded id (PostgreSQL)."""
+
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        for table in tables:
+            if "id" not in table.c or table.c.id.autoincrement is False:
+                continue
+            conn.execute(
+                text(
+                    "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                    f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table.name}"
+                ),
+                {"table": table.name},
+            )
+
+
+def report(label, count, seconds):
+    """Print one line of load statistics."""
+
+    rate = count / seconds if seconds else float("inf")
+    print(f"{label:<24} {count:>12,} rows {seconds:>9.2f}s {rate:>12,.0f} rows/s")
+
+
+def seed(data_dir="generator", batch_size=DEFAULT_BATCH_SIZE):
+    """Recreate the schema and load the CSVs in `data_dir`."""
+
+    engine = db.engine
+    tables = [table for table, _ in CSV_TABLES]
+
+    db.drop_all()
+    db.create_all()
+    deferred = defer_constraints(engine, tables)
+
+    for table, filename in CSV_TABLES:
+        count, seconds = load_table(
+            engine, table, f"{data_dir}/{filename}", batch_size
+        )
+        report(table.name, count, seconds)
+
+    start = time.perf_counter()
+    restore_constraints(engine, deferred)
+    reset_sequences(engine, tables)
+    print(f"{'indexes/foreign keys':<24} {time.perf_counter() - start:>27.2f}s")
 
+    derived = [
+        ("timeline_entries", TimelineEntry.backfill),
+        ("users recounted", User.recount_counters),
+        ("user_search_grams", UserSearchGram.rebuild),
+    ]
+    for label, build in derived:
+        start = time.perf_counter()
+        count = build()
+        db.session.commit()
+        report(label, count, time.perf_counter() - start)
 
-db.drop_all()
-db.create_all()
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+def main():
+    parser = argparse.ArgumentParser(description="Seed Warbler from CSV files.")
+    parser.add_argument("--data-dir", default="generator")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+    seed(args.data_dir, args.batch_size)
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
 
-db.session.commit()
+if __name__ == "__main__":
+    main()
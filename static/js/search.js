@@ -0,0 +1,36 @@
+// Suggest usernames in the nav search box as the user types.
+
+(function () {
+  const input = document.getElementById("search");
+  const list = document.getElementById("search-suggestions");
+  if (!input || !list) return;
+
+  let timer = null;
+  let lastQuery = "";
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(suggest, 150);
+  });
+
+  async function suggest() {
+    const q = input.value.trim();
+    if (q === lastQuery) return;
+    lastQuery = q;
+
+    if (!q) {
+      list.innerHTML = "";
+      return;
+    }
+
+    const res = await fetch(`/users/autocomplete?q=${encodeURIComponent(q)}`);
+    if (!res.ok || q !== lastQuery) return;
+
+    list.innerHTML = "";
+    for (const user of await res.json()) {
+      const option = document.createElement("option");
+      option.value = user.username;
+      list.appendChild(option);
+    }
+  }
+})();
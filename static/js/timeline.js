@@ -0,0 +1,35 @@
+// Add messages to the top of the home timeline as they're posted, over a
+// server-sent events connection, instead of reloading the page to check.
+
+(function () {
+  const list = document.getElementById("messages");
+  if (!list || !list.dataset.live || !window.EventSource) return;
+
+  const source = new EventSource(list.dataset.live);
+  const shown = new Set();
+
+  source.addEventListener("message", function (event) {
+    const msg = JSON.parse(event.data);
+    if (shown.has(msg.id)) return;
+    shown.add(msg.id);
+
+    const item = document.createElement("li");
+    item.className = "list-group-item";
+    item.innerHTML = msg.html;
+
+    const form = document.createElement("form");
+    form.method = "POST";
+    form.action = `/users/like/${msg.id}`;
+    form.innerHTML =
+      '<button class="btn btn-sm btn-secondary"><i class="fa fa-thumbs-down"></i></button>';
+    item.appendChild(form);
+
+    list.prepend(item);
+  });
+
+  // the connection fell behind and events were dropped: start over
+  source.addEventListener("reset", function () {
+    source.close();
+    window.location.reload();
+  });
+})();
@@ -7,9 +7,12 @@
 
 
 import os
+from contextlib import contextmanager
 from unittest import TestCase
 
-from models import db, User, Message, Follows, Likes
+from datetime import datetime
+from sqlalchemy import event
+from models import db, User, Message, Follows, Likes, TimelineEntry
 
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
 
@@ -19,6 +22,35 @@ from app import app
 db.create_all()
 
 
+@contextmanager
+def captured_statements():
+    """Collect the `(statement, parameters)` of every query run in the block."""
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+
+def query_plans(statements):
+    """EXPLAIN `statements` with sequential scans priced out, so a plan only
+    falls back to one when no index fits."""
+
+    plans = []
+    with db.engine.connect() as conn, conn.begin():
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            plans.append("\n".join(row[0] for row in rows))
+    return "\n".join(plans)
+
+
 class UserModelTestCase(TestCase):
     """Test message model"""
 
@@ -66,3 +98,143 @@ class UserModelTestCase(TestCase):
 
         self.assertIn(meassages[0], u.likes)
         self.assertIn(meassages[1], u.likes)
+        self.assertEqual(
+            u.liked_message_ids(meassages), {msg.id for msg in meassages}
+        )
+        self.assertEqual(u2.liked_message_ids(meassages), set())
+
+    def test_timeline_backfill(self):
+        """Does backfill put own and followed messages on each timeline?"""
+        u = User(id=123, email="test@email.com", username="testUser", password="123456")
+        u2 = User(
+            id=234, email="test2@email2.com", username="testUser2", password="654321"
+        )
+        db.session.add_all([u, u2])
+        db.session.commit()
+
+        db.session.add_all(
+            [
+                Message(id=1, text="test1", user_id=123),
+                Message(id=2, text="test2", user_id=234),
+                Follows(user_being_followed_id=234, user_following_id=123),
+            ]
+        )
+        db.session.commit()
+
+        self.assertEqual(TimelineEntry.backfill(), 3)
+        db.session.commit()
+
+        self.assertEqual(
+            [msg.id for msg in TimelineEntry.page_for(123)], [2, 1]
+        )
+        self.assertEqual([msg.id for msg in TimelineEntry.page_for(234)], [2])
+
+    def test_add_author_is_capped(self):
+        """Does following an author copy only their latest messages over?"""
+        u = User(id=123, email="test@email.com", username="testUser", password="123456")
+        u2 = User(
+            id=234, email="test2@email2.com", username="testUser2", password="654321"
+        )
+        db.session.add_all([u, u2])
+        db.session.commit()
+
+        for i in range(1, 6):
+            db.session.add(
+                Message(id=i, text=f"test{i}", user_id=234, timestamp=datetime(2020, 1, i))
+            )
+        db.session.commit()
+
+        TimelineEntry.add_author(123, 234, limit=3)
+        TimelineEntry.add_author(123, 234, limit=3)
+        db.session.commit()
+
+        self.assertEqual([msg.id for msg in TimelineEntry.page_for(123)], [5, 4, 3])
+
+    def test_reconcile_counters(self):
+        """Does reconcile_counters report and fix counters that drifted?"""
+        u = User(id=123, email="test@email.com", username="testUser", password="123456")
+        u2 = User(
+            id=234, email="test2@email2.com", username="testUser2", password="654321"
+        )
+        db.session.add_all([u, u2])
+        db.session.commit()
+
+        db.session.add(Message(id=1, text="test1", user_id=234))
+        db.session.commit()
+        db.session.add(Likes(user_id=123, message_id=1))
+        db.session.commit()
+
+        drift = User.reconcile_counters()
+        db.session.commit()
+
+        self.assertEqual(
+            drift, [(123, "likes_count", 0, 1), (234, "messages_count", 0, 1)]
+        )
+        self.assertEqual(User.query.get(123).likes_count, 1)
+        self.assertEqual(User.reconcile_counters(), [])
+
+        User.adjust_counters(234, messages_count=5)
+        self.assertEqual(User.recount_counters(), 1)
+        self.assertEqual(User.recount_counters(), 0)
+        db.session.commit()
+        self.assertEqual(User.query.get(234).messages_count, 1)
+
+    def test_page_liked_by(self):
+        """Are liked messages listed by when they were liked, not posted?"""
+        u = User(id=123, email="test@email.com", username="testUser", password="123456")
+        db.session.add(u)
+        db.session.commit()
+
+        db.session.add_all(
+            [
+                Message(id=1, text="old", user_id=123, timestamp=datetime(2020, 1, 1)),
+                Message(id=2, text="new", user_id=123, timestamp=datetime(2021, 1, 1)),
+            ]
+        )
+        db.session.commit()
+        db.session.add_all(
+            [
+                Likes(user_id=123, message_id=2, timestamp=datetime(2022, 1, 1)),
+                Likes(user_id=123, message_id=1, timestamp=datetime(2022, 2, 1)),
+            ]
+        )
+        db.session.commit()
+
+        page = Message.page_liked_by(123)
+        self.assertEqual([msg.id for msg in page], [1, 2])
+        self.assertEqual(page.items[0].user.username, "testUser")
+
+    def test_hot_queries_use_indexes(self):
+        """Do the timeline, profile, likes, follows and delete queries read
+        through their indexes?"""
+        u = User(id=123, email="test@email.com", username="testUser", password="123456")
+        u2 = User(
+            id=234, email="test2@email2.com", username="testUser2", password="654321"
+        )
+        db.session.add_all([u, u2])
+        db.session.commit()
+        db.session.add(Follows(user_being_followed_id=234, user_following_id=123))
+        db.session.add(Message(id=1, text="test1", user_id=234))
+        db.session.commit()
+        db.session.add(Likes(user_id=123, message_id=1))
+        TimelineEntry.backfill()
+        db.session.commit()
+
+        hot_queries = {
+            "ix_timeline_entries_user_id_timestamp": lambda: TimelineEntry.page_for(123),
+            "ix_messages_user_id_timestamp": lambda: Message.page_by_author(234),
+            "ix_likes_user_id_timestamp": lambda: Message.page_liked_by(123),
+            "ix_follows_user_following_id": lambda: User.query.get(123).following,
+            "ix_likes_message_id": lambda: User.adjust_counters(
+                db.select(Likes.user_id).where(Likes.message_id == 1), likes_count=-1
+            ),
+            "ix_timeline_entries_message_id": lambda: TimelineEntry.remove_message(1),
+        }
+
+        for index, run in hot_queries.items():
+            with self.subTest(index=index):
+                db.session.expire_all()
+                with captured_statements() as statements:
+                    run()
+                db.session.rollback()
+                self.assertIn(index, query_plans(statements))
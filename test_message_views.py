@@ -8,12 +8,14 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User, Likes
+from models import db, connect_db, Message, User, Likes, Follows, TimelineEntry
 
 
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
 
-from app import app, CURR_USER_KEY
+from app import app, CURR_USER_KEY, current_users, fragments
+from pubsub import hub
+from query_stats import assert_max_queries
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -34,6 +36,8 @@ class MessageViewTestCase(TestCase):
 
         db.drop_all()
         db.create_all()
+        fragments.clear()
+        current_users.clear()
 
         self.client = app.test_client()
 
@@ -72,6 +76,61 @@ class MessageViewTestCase(TestCase):
 
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
+            self.assertEqual(User.query.get(123).messages_count, 1)
+
+    def test_add_message_fans_out(self):
+        """
+        Does a new message land on the author's and followers' timelines?
+        """
+        db.session.add(Follows(user_being_followed_id=123, user_following_id=234))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            c.post("/messages/new", data={"text": "Hello"})
+            msg = Message.query.one()
+
+            entries = TimelineEntry.query.filter_by(message_id=msg.id).all()
+            self.assertEqual(sorted(e.user_id for e in entries), [123, 234])
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 234
+
+            res = c.get("/")
+            self.assertIn("Hello", res.get_data(as_text=True))
+
+    def test_live_timeline(self):
+        """Are new messages pushed to connected followers, up to the cap?"""
+        db.session.add(Follows(user_being_followed_id=123, user_following_id=234))
+        db.session.commit()
+
+        follower = app.test_client()
+        with follower.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 234
+        res = follower.get("/timeline/stream", buffered=False)
+        self.assertEqual(res.mimetype, "text/event-stream")
+        stream = iter(res.response)
+        self.assertTrue(next(stream).startswith(b"retry:"))
+
+        max_subscribers, hub.max_subscribers = hub.max_subscribers, 1
+        try:
+            self.assertEqual(follower.get("/timeline/stream").status_code, 503)
+        finally:
+            hub.max_subscribers = max_subscribers
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+            c.post("/messages/new", data={"text": "Hello live"})
+
+        event = next(stream).decode()
+        self.assertTrue(event.startswith(f"id: {Message.query.one().id}\n"))
+        self.assertIn("Hello live", event)
+
+        res.close()
+        self.assertEqual(hub.stats()["subscribers"], 0)
 
     def test_loggedOut_add_message(self):
         """
@@ -111,6 +170,32 @@ class MessageViewTestCase(TestCase):
             html = res.get_data(as_text=True)
             self.assertIn("test msg 1", html)
 
+    def test_show_message_conditional_get(self):
+        """
+        Does a message page answer 304 until its author changes?
+        """
+        db.session.add(Message(id=123, text="test msg 1", user_id=234))
+        db.session.commit()
+
+        with self.client as c:
+            res = c.get("/messages/123")
+            etag = res.headers["ETag"]
+            last_modified = res.headers["Last-Modified"]
+
+            res = c.get("/messages/123", headers={"If-None-Match": etag})
+            self.assertEqual(res.status_code, 304)
+
+            res = c.get(
+                "/messages/123",
+                headers={"If-Modified-Since": last_modified},
+            )
+            self.assertEqual(res.status_code, 304)
+
+            User.adjust_counters(234, likes_count=1)
+            db.session.commit()
+            res = c.get("/messages/123", headers={"If-None-Match": etag})
+            self.assertEqual(res.status_code, 200)
+
     def test_show_invalid_message(self):
         """
         Can use add a message when looged in?
@@ -143,6 +228,7 @@ class MessageViewTestCase(TestCase):
             self.assertEqual(res.status_code, 302)
             msgs = Message.query.filter_by(id=234).all()
             self.assertEqual(msgs, [])
+            self.assertEqual(TimelineEntry.query.filter_by(message_id=234).all(), [])
 
     def test_loggedOut_delete_message(self):
         """
@@ -202,6 +288,7 @@ class MessageViewTestCase(TestCase):
 
             self.assertEqual(likes.user_id, 123)
             self.assertEqual(likes.message_id, 123)
+            self.assertEqual(User.query.get(123).likes_count, 1)
 
             ##unlikes the message since the user has like that message before
             res = c.post(f"/users/like/123")
@@ -209,6 +296,31 @@ class MessageViewTestCase(TestCase):
 
             likes = Likes.query.filter_by(user_id=123, message_id=123).all()
             self.assertEqual(likes, [])
+            self.assertEqual(User.query.get(123).likes_count, 0)
+
+    def test_likes_page(self):
+        """
+        Does the likes page list liked messages with an active like button?
+        """
+        db.session.add_all(
+            [
+                Message(id=123, text="liked msg", user_id=234),
+                Message(id=124, text="other msg", user_id=234),
+            ]
+        )
+        db.session.commit()
+        db.session.add(Likes(user_id=123, message_id=123))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.get("/users/123/likes")
+            html = res.get_data(as_text=True)
+            self.assertIn("liked msg", html)
+            self.assertNotIn("other msg", html)
+            self.assertIn("fa-thumbs-up", html)
 
     def test_loggedOut_like(self):
         """
@@ -251,3 +363,60 @@ class MessageViewTestCase(TestCase):
             res = c.post(f"/users/like/{234}", follow_redirects=True)
             html = res.get_data(as_text=True)
             self.assertIn("You can&#39;t like your own message", html)
+
+    def test_timeline_query_count(self):
+        """
+        Does the homepage load in a fixed number of queries however many
+        authors and likes are on it?
+        """
+        authors = [
+            User(id=300 + i, username=f"author{i}", email=f"a{i}@test.com", password="x")
+            for i in range(10)
+        ]
+        db.session.add_all(authors)
+        db.session.commit()
+        for author in authors:
+            db.session.add(Follows(user_being_followed_id=author.id, user_following_id=123))
+            db.session.add(Message(id=author.id, text=f"by {author.username}", user_id=author.id))
+        db.session.commit()
+        db.session.add_all([Likes(user_id=123, message_id=a.id) for a in authors])
+        TimelineEntry.backfill()
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            with assert_max_queries(4):
+                res = c.get("/")
+            self.assertIn("by author9", res.get_data(as_text=True))
+            self.assertIn("X-Query-Count", res.headers)
+
+            with assert_max_queries(4):
+                c.get("/users/123/likes")
+
+    def test_message_card_cache(self):
+        """
+        Are message cards reused across pages, and dropped on profile edits
+        and deletes?
+        """
+        db.session.add(Message(id=123, text="cached msg", user_id=123))
+        TimelineEntry.backfill()
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            c.get("/")
+            res = c.get("/users/123")
+            self.assertIn("cached msg", res.get_data(as_text=True))
+            self.assertEqual(fragments.stats()["hits"], 1)
+
+            c.post("/users/profile", data={"username": "renamed", "password": "testuser"})
+            self.assertEqual(len(fragments), 0)
+            res = c.get("/")
+            self.assertIn("@renamed</a>", res.get_data(as_text=True))
+
+            c.post("/messages/123/delete")
+            self.assertEqual(len(fragments), 0)
@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, User, Message, Follows
+from models import db, User, Message, Follows, hasher
 from sqlalchemy import exc
 
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
@@ -99,6 +99,25 @@ class UserModelTestCase(TestCase):
 
         self.assertEqual(u.is_followed_by(u2), True)
 
+    def test_following_ids_among(self):
+        """Tests the batch follow checks answer for a whole list of users"""
+
+        u = User(email="test@email.com", username="testUser", password="123456")
+        u2 = User(email="test2@email2.com", username="testUser2", password="654321")
+        u3 = User(email="test3@email3.com", username="testUser3", password="654321")
+
+        db.session.add_all([u, u2, u3])
+        db.session.commit()
+
+        u.following.append(u2)
+        u3.following.append(u)
+        db.session.commit()
+
+        ids = [u.id, u2.id, u3.id]
+        self.assertEqual(u.following_ids_among(ids), {u2.id})
+        self.assertEqual(u.followed_by_ids_among(ids), {u3.id})
+        self.assertEqual(u.following_ids_among([]), set())
+
     def test_User_create(self):
         """Tests if signup works as expected"""
         u = User.signup(
@@ -149,3 +168,23 @@ class UserModelTestCase(TestCase):
         self.assertEqual(User.authenticate(username="testUser", password="123456"), u)
         self.assertEqual(User.authenticate(username="testUser", password="1236"), False)
         self.assertEqual(User.authenticate(username="tUser", password="123456"), False)
+
+    def test_User_authenticate_rehash(self):
+        """Tests authenticate upgrades a hash made at an old bcrypt cost"""
+        u = User.signup(
+            email="test@email.com", username="testUser", password="123456", image_url=""
+        )
+        db.session.commit()
+        old_hash = u.password
+        rounds = hasher.rounds
+
+        hasher.rounds = 4
+        try:
+            self.assertEqual(User.authenticate("testUser", "123456"), u)
+            db.session.commit()
+        finally:
+            hasher.rounds = rounds
+
+        self.assertNotEqual(u.password, old_hash)
+        self.assertTrue(u.password.startswith("$2b$04$"))
+        self.assertEqual(User.authenticate("testUser", "123456"), u)
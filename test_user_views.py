@@ -5,16 +5,35 @@
 #    FLASK_ENV=production python -m unittest test_user_views.py
 
 import os
+import tempfile
+from datetime import datetime
 from unittest import TestCase
-from models import db, connect_db, Message, User, Likes, Follows
+from models import (
+    db,
+    connect_db,
+    Message,
+    User,
+    Likes,
+    Follows,
+    TimelineEntry,
+    UserSearchGram,
+)
 
 
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
-from app import app, CURR_USER_KEY
+from flask import url_for
+from app import app, CURR_USER_KEY, current_users, fragments
+from query_stats import assert_max_queries
+from purge import pending_user_ids, purge_user, purger
+from replica import REPLICA_BIND, STICKY_KEY
 
 db.create_all()
 
 app.config["WTF_CSRF_ENABLED"] = False
+app.config["PURGE_INLINE"] = True
+
+# stands in for a read replica in the replica routing test
+REPLICA_URL = "sqlite:///" + os.path.join(tempfile.gettempdir(), "warbler_replica.db")
 
 
 class UserViewTestCase(TestCase):
@@ -24,6 +43,8 @@ class UserViewTestCase(TestCase):
         """Create test client, add sample data."""
         db.drop_all()
         db.create_all()
+        fragments.clear()
+        current_users.clear()
 
         self.client = app.test_client()
 
@@ -46,6 +67,10 @@ class UserViewTestCase(TestCase):
         db.session.add(self.testuser2)
         db.session.commit()
 
+    def tearDown(self):
+        """Don't leave a transaction open to block the next drop_all."""
+        db.session.rollback()
+
     def test_follower_page(self):
         """Can you see the follower page if logged in?"""
         with self.client as c:
@@ -167,3 +192,347 @@ class UserViewTestCase(TestCase):
             ).one()
             self.assertEqual(follows.user_being_followed_id, 123)
             self.assertEqual(follows.user_following_id, 234)
+
+    def test_follow_updates_timeline(self):
+        """Does following add, and unfollowing remove, the user's messages on your timeline?"""
+        msg = Message(id=345, text="test msg 1", user_id=234)
+        db.session.add(msg)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            c.post("/users/follow/234")
+            entry = TimelineEntry.query.filter_by(user_id=123).one()
+            self.assertEqual(entry.message_id, 345)
+
+            res = c.get("/")
+            self.assertIn("test msg 1", res.get_data(as_text=True))
+
+            c.post("/users/stop-following/234")
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=123).all(), [])
+
+    def test_profile_pagination(self):
+        """Can you page back through a user's messages with the older/newer cursors?"""
+        for i in range(105):
+            db.session.add(Message(id=1000 + i, text=f"warble {i}", user_id=234))
+        db.session.commit()
+
+        with self.client as c:
+            res = c.get("/users/234")
+            html = res.get_data(as_text=True)
+            self.assertIn("warble 104", html)
+            self.assertNotIn("warble 4<", html)
+            self.assertIn("Older", html)
+            self.assertNotIn("Newer", html)
+
+            older = Message.page_by_author(234).older
+            res = c.get(f"/users/234?before={older}")
+            html = res.get_data(as_text=True)
+            self.assertIn("warble 4<", html)
+            self.assertNotIn("warble 5<", html)
+            self.assertIn("Newer", html)
+            self.assertNotIn("Older", html)
+
+    def test_follow_counters(self):
+        """Do following and unfollowing keep both users' counters up to date?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            c.post("/users/follow/234")
+            self.assertEqual(User.query.get(123).following_count, 1)
+            self.assertEqual(User.query.get(234).followers_count, 1)
+
+            c.post("/users/stop-following/234")
+            self.assertEqual(User.query.get(123).following_count, 0)
+            self.assertEqual(User.query.get(234).followers_count, 0)
+
+    def test_user_list_follow_buttons(self):
+        """Does the user list show Unfollow only for users you follow?"""
+        db.session.add(Follows(user_being_followed_id=234, user_following_id=123))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.get("/users")
+            html = res.get_data(as_text=True)
+            self.assertIn('action="/users/stop-following/234"', html)
+            self.assertNotIn('action="/users/follow/234"', html)
+
+    def test_profile_update_refreshes_current_user(self):
+        """Does editing your profile show up immediately despite the user cache?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.get("/")
+            self.assertIn("@testuser<", res.get_data(as_text=True))
+
+            res = c.post(
+                "/users/profile",
+                data={"username": "renamed", "password": "testuser"},
+            )
+            self.assertEqual(res.status_code, 302)
+
+            res = c.get("/")
+            html = res.get_data(as_text=True)
+            self.assertIn("@renamed<", html)
+            self.assertNotIn("@testuser<", html)
+
+    def test_search_users(self):
+        """Does search rank the closest username first and skip non-matches?"""
+        UserSearchGram.rebuild()
+        db.session.commit()
+
+        with self.client as c:
+            res = c.get("/users?q=user2")
+            html = res.get_data(as_text=True)
+            self.assertIn("@testuser2", html)
+            self.assertLess(html.index("@testuser2"), html.find("@testuser<"))
+
+            res = c.get("/users?q=nobody")
+            self.assertIn("Sorry, no users found", res.get_data(as_text=True))
+
+    def test_autocomplete_users(self):
+        """Does autocomplete return only usernames starting with the prefix?"""
+        UserSearchGram.rebuild()
+        db.session.commit()
+
+        with self.client as c:
+            res = c.get("/users/autocomplete?q=TestUser")
+            self.assertEqual(
+                [user["username"] for user in res.json], ["testuser", "testuser2"]
+            )
+
+            res = c.get("/users/autocomplete?q=user")
+            self.assertEqual(res.json, [])
+
+    def test_user_pages_query_count(self):
+        """Do the user list and follow pages avoid a query per user shown?"""
+        for i in range(10):
+            db.session.add(
+                User(id=300 + i, username=f"user{i}", email=f"u{i}@test.com", password="x")
+            )
+        db.session.commit()
+        for i in range(10):
+            db.session.add(Follows(user_being_followed_id=300 + i, user_following_id=123))
+            db.session.add(Follows(user_being_followed_id=123, user_following_id=300 + i))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            for path in ["/users", "/users/123", "/users/123/following", "/users/123/followers"]:
+                with assert_max_queries(4):
+                    res = c.get(path)
+                self.assertEqual(res.status_code, 200)
+
+    def test_profile_conditional_get(self):
+        """Does a profile answer 304 until the user or the viewer changes?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.get("/users/234")
+            etag = res.headers["ETag"]
+            self.assertIn("no-cache", res.headers["Cache-Control"])
+
+            res = c.get("/users/234", headers={"If-None-Match": etag})
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.get_data(), b"")
+
+            # a write made through another worker leaves this one's cached
+            # snapshot of the viewer stale
+            db.session.add(Follows(user_being_followed_id=234, user_following_id=123))
+            User.adjust_counters(123, following_count=1)
+            db.session.commit()
+            res = c.get("/users/234", headers={"If-None-Match": etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn("Unfollow", res.get_data(as_text=True))
+
+    def test_reads_from_replica_until_own_write(self):
+        """Do read-only pages read the replica, but the primary just after
+        the user's own write?"""
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: REPLICA_URL}
+        try:
+            replica = db.get_engine(app, bind=REPLICA_BIND)
+            db.metadata.drop_all(replica)
+            db.metadata.create_all(replica)
+            # the replica hasn't caught up with testuser2's bio yet
+            with replica.begin() as conn:
+                for user in User.query.order_by(User.id):
+                    conn.execute(
+                        User.__table__.insert(),
+                        {c.name: getattr(user, c.name) for c in User.__table__.c},
+                    )
+                conn.execute(User.__table__.update().values(bio="stale bio"))
+            User.query.get(234).bio = "fresh bio"
+            db.session.commit()
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = 123
+
+                self.assertIn("stale bio", c.get("/users/234").get_data(as_text=True))
+
+                c.post("/users/follow/234")
+                res = c.get("/users/234")
+                self.assertIn("fresh bio", res.get_data(as_text=True))
+                self.assertIn("Unfollow", res.get_data(as_text=True))
+
+                with c.session_transaction() as sess:
+                    sess[STICKY_KEY] = 0
+                self.assertIn("stale bio", c.get("/users/234").get_data(as_text=True))
+        finally:
+            app.config["SQLALCHEMY_BINDS"] = None
+
+    def test_api_timeline_and_profile(self):
+        """Does the JSON API page the timeline and honour sparse fieldsets?"""
+        db.session.add(Message(id=345, text="test msg 1", user_id=234))
+        db.session.commit()
+
+        with self.client as c:
+            res = c.get("/api/v1/timeline")
+            self.assertEqual(res.status_code, 401)
+            self.assertEqual(res.get_json()["status"], 401)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+            c.post("/users/follow/234")
+            c.post("/users/like/345")
+
+            data = c.get("/api/v1/timeline").get_json()
+            self.assertEqual(data["data"][0]["text"], "test msg 1")
+            self.assertEqual(data["data"][0]["user"]["username"], "testuser2")
+            self.assertTrue(data["data"][0]["liked"])
+            self.assertIsNone(data["older"])
+
+            data = c.get(
+                "/api/v1/users/234?fields[message]=id&fields[user]=id,followers_count"
+            ).get_json()
+            self.assertEqual(data["user"], {"id": 234, "followers_count": 1})
+            self.assertEqual(data["data"], [{"id": 345}])
+
+            res = c.get("/api/v1/users/234?fields[user]=password")
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(c.get("/api/v1/messages/999").status_code, 404)
+
+    def test_api_follow_lists_streamed(self):
+        """Are follow lists streamed a page at a time, by user id?"""
+        for i in range(3):
+            db.session.add(
+                User(id=300 + i, username=f"fan{i}", email=f"fan{i}@test.com", password="x")
+            )
+        db.session.commit()
+        for i in range(3):
+            db.session.add(Follows(user_being_followed_id=234, user_following_id=300 + i))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.get("/api/v1/users/234/followers?limit=2&fields[user]=username")
+            self.assertTrue(res.is_streamed)
+            data = res.get_json()
+            self.assertEqual(data["data"], [{"username": "fan0"}, {"username": "fan1"}])
+            self.assertEqual(data["next"], 301)
+
+            data = c.get("/api/v1/users/234/followers?limit=2&after_id=301").get_json()
+            self.assertEqual([u["id"] for u in data["data"]], [302])
+            self.assertIsNone(data["next"])
+
+    def test_static_files_immutable(self):
+        """Are static files linked by content hash and cached forever?"""
+        with self.client as c:
+            res = c.get("/users")
+            self.assertIn("/static/stylesheets/style.css?v=", res.get_data(as_text=True))
+
+            with app.test_request_context():
+                url = url_for("static", filename="stylesheets/style.css")
+            res = c.get(url)
+            self.assertIn("immutable", res.headers["Cache-Control"])
+            res.close()
+
+    def test_delete_user(self):
+        """Does deleting an account remove its rows and fix others' counters?"""
+        db.session.add_all(
+            [
+                Follows(user_being_followed_id=234, user_following_id=123),
+                Follows(user_being_followed_id=123, user_following_id=234),
+                Message(id=1, text="mine", user_id=123),
+                Message(id=2, text="mine too", user_id=123),
+                Message(id=3, text="theirs", user_id=234),
+            ]
+        )
+        db.session.commit()
+        db.session.add_all(
+            [Likes(user_id=234, message_id=1), Likes(user_id=123, message_id=3)]
+        )
+        TimelineEntry.backfill()
+        User.reconcile_counters()
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 123
+
+            res = c.post("/users/delete")
+            self.assertEqual(res.status_code, 302)
+
+            self.assertIsNone(User.query.get(123))
+            self.assertEqual(Follows.query.all(), [])
+            self.assertEqual(Likes.query.all(), [])
+            self.assertEqual([m.id for m in Message.query.all()], [3])
+            self.assertEqual([e.user_id for e in TimelineEntry.query.all()], [234])
+            self.assertEqual(User.reconcile_counters(fix=False), [])
+
+    def test_deleted_user_hidden_until_purged(self):
+        """Is a deleted account hidden at once and its purge resumable?"""
+        for i in range(5):
+            db.session.add(Message(id=i + 1, text=f"msg {i}", user_id=123))
+        db.session.add(Follows(user_being_followed_id=123, user_following_id=234))
+        db.session.commit()
+        db.session.add(Likes(user_id=234, message_id=1))
+        TimelineEntry.backfill()
+        User.query.get(123).deleted_at = datetime.utcnow()
+        db.session.commit()
+
+        with self.client as c:
+            self.assertEqual(c.get("/users/123").status_code, 404)
+            self.assertEqual(c.get("/messages/1").status_code, 404)
+            self.assertNotIn("@testuser<", c.get("/users").get_data(as_text=True))
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 234
+            self.assertNotIn("msg 1", c.get("/").get_data(as_text=True))
+            self.assertNotIn("msg 0", c.get("/users/234/likes").get_data(as_text=True))
+            self.assertEqual(c.post("/users/like/2").status_code, 404)
+
+            self.assertFalse(User.authenticate("testuser", "testuser"))
+            self.assertEqual(pending_user_ids(), [123])
+            totals = purge_user(123, batch_size=2)
+            self.assertEqual(totals["messages"], 5)
+            self.assertEqual(totals["followers"], 1)
+            self.assertEqual(pending_user_ids(), [])
+
+    def test_background_purge(self):
+        """Does a purge submitted without PURGE_INLINE run on the worker?"""
+        db.session.add(Message(id=1, text="msg", user_id=123))
+        User.query.get(123).deleted_at = datetime.utcnow()
+        db.session.commit()
+        db.session.remove()
+
+        app.config["PURGE_INLINE"] = False
+        try:
+            totals = purger.submit(123).result(timeout=30)
+        finally:
+            app.config["PURGE_INLINE"] = True
+
+        self.assertEqual(totals["messages"], 1)
+        self.assertEqual(pending_user_ids(), [])